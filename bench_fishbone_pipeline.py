@@ -0,0 +1,82 @@
+# bench_fishbone_pipeline.py
+# Microbenchmark for the fishbone verify-to-save path: the previous row-by-row
+# implementation (nested loops, iterrows validation, to_dict('records') + per-row
+# tuples) against fishbone_pipeline (explode, vectorized masks, CSV COPY buffer).
+# No database connection is made; only the Python-side work is timed.
+#
+#   python bench_fishbone_pipeline.py            # 1k and 100k rows
+#   python bench_fishbone_pipeline.py 5000 250000
+import sys
+import time
+import pandas as pd
+import fishbone_pipeline
+
+def make_ai_data(rows: int) -> dict:
+    """A normalized fishbone response with `rows` details spread over 6 main causes."""
+    per_sub = 10
+    subs = max(1, rows // per_sub)
+    return {'causes': [
+        {'main_cause': f"Cause {c}", 'sub_causes': [
+            {'sub_cause': f"Sub {c}.{s}", 'details': [f"detail {c}.{s}.{d}" for d in range(per_sub)]}
+            for s in range(c, subs, 6)
+        ]} for c in range(6)
+    ]}
+
+# --- The previous implementation, kept here only for comparison ---
+def legacy_flatten(ai_data):
+    flat_list = []
+    for cause_group in ai_data.get('causes', []):
+        main_cause = cause_group.get('main_cause', '')
+        sub_causes_list = cause_group.get('sub_causes') or [{'sub_cause': '', 'details': cause_group.get('details', [])}]
+        for sub_group in sub_causes_list:
+            sub_cause = sub_group.get('sub_cause', '')
+            for detail in sub_group.get('details', []):
+                flat_list.append({'main_cause': main_cause, 'sub_cause': sub_cause, 'detail': detail})
+    df = pd.DataFrame(flat_list).fillna('')
+    df['row_comment'] = ''
+    return df
+
+def legacy_validate(df):
+    return all(row['main_cause'] and row['detail'] for index, row in df.iterrows())
+
+def legacy_serialize(df):
+    records = df.to_dict('records')
+    return [('s', 'p', 'g', r.get('main_cause'), r.get('sub_cause'), r.get('detail'), r.get('row_comment', '')) for r in records]
+
+# --- The columnar pipeline ---
+def pipeline_flatten(ai_data):
+    return fishbone_pipeline.flatten_ai_data(ai_data)
+
+def pipeline_validate(df):
+    return len(fishbone_pipeline.validate_frame(df)) == 0
+
+def pipeline_serialize(df):
+    return fishbone_pipeline.to_copy_buffer(fishbone_pipeline.prepare_frame(df), 's', 'p', 'g')
+
+def best_of(func, arg, repeats: int) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter(); func(arg); best = min(best, time.perf_counter() - start)
+    return best
+
+def run(rows: int):
+    ai_data = make_ai_data(rows)
+    repeats = 5 if rows <= 10_000 else 1
+    legacy_df, pipeline_df = legacy_flatten(ai_data), pipeline_flatten(ai_data)
+    steps = [
+        ("flatten", legacy_flatten, pipeline_flatten, ai_data, ai_data),
+        ("validate", legacy_validate, pipeline_validate, legacy_df, pipeline_df),
+        ("serialize", legacy_serialize, pipeline_serialize, legacy_df, pipeline_df),
+    ]
+    print(f"\n--- {len(pipeline_df):,} rows (best of {repeats}) ---")
+    print(f"{'step':<12}{'row-by-row ms':>16}{'columnar ms':>14}{'speedup':>10}")
+    total_legacy = total_pipeline = 0.0
+    for name, legacy, pipeline, legacy_arg, pipeline_arg in steps:
+        t_legacy, t_pipeline = best_of(legacy, legacy_arg, repeats), best_of(pipeline, pipeline_arg, repeats)
+        total_legacy += t_legacy; total_pipeline += t_pipeline
+        print(f"{name:<12}{t_legacy * 1000:>16.1f}{t_pipeline * 1000:>14.1f}{t_legacy / t_pipeline:>9.1f}x")
+    print(f"{'total':<12}{total_legacy * 1000:>16.1f}{total_pipeline * 1000:>14.1f}{total_legacy / total_pipeline:>9.1f}x")
+
+if __name__ == "__main__":
+    for rows in [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000]:
+        run(rows)
@@ -38,5 +38,32 @@ DB_PARAMS = {
     'port': db_port
 }
 
+# --- Write-Behind Spool Settings (optional) ---
+# Verified records are first written to this local SQLite file, then flushed
+# to PostgreSQL in the background by write_spool.py.
+WRITE_SPOOL_PATH = os.getenv('WRITE_SPOOL_PATH', os.path.join(basedir, 'write_spool.db'))
+WRITE_SPOOL_BATCH_SIZE = int(os.getenv('WRITE_SPOOL_BATCH_SIZE', '50'))
+WRITE_SPOOL_MAX_BACKOFF = int(os.getenv('WRITE_SPOOL_MAX_BACKOFF', '60')) # seconds
+# A job still failing after this many attempts is parked (shown in the sidebar) instead of retried forever
+WRITE_SPOOL_MAX_ATTEMPTS = int(os.getenv('WRITE_SPOOL_MAX_ATTEMPTS', '20'))
+
+# --- Read Replica Settings (optional) ---
+# Semicolon-separated libpq connection strings for streaming-replication
+# replicas, e.g. "host=127.0.0.1 port=5433 dbname=app user=app password=...".
+# When empty, every query goes to the primary defined above.
+DB_READ_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv('DB_READ_REPLICA_DSNS', '').split(';') if dsn.strip()]
+DB_READ_POOL_MAX = int(os.getenv('DB_READ_POOL_MAX', '10'))
+DB_READ_CONNECT_TIMEOUT = int(os.getenv('DB_READ_CONNECT_TIMEOUT', '3')) # seconds, per replica connection attempt
+# A replica that fails to connect is skipped (reads go elsewhere) for this long
+DB_READ_REPLICA_COOLDOWN = float(os.getenv('DB_READ_REPLICA_COOLDOWN', '30'))
+# After a session is written, its reads stay on the primary this long (covers replication lag)
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', '10'))
+
+# --- AI Response Corpus (optional) ---
+# When set, every Gemini response that needed repair or was unrecoverable is
+# saved here (one file per response, under mindmap/ or fishbone/) so the repair
+# rate can be measured with `python main.py repair-report <dir>`.
+AI_RESPONSE_CORPUS_DIR = os.getenv('AI_RESPONSE_CORPUS_DIR')
+
 # Add this at the very end of config.py
 print("--- DEBUG: DB_PARAMS loaded in config.py ---", DB_PARAMS)
\ No newline at end of file
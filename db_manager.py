@@ -1,50 +1,256 @@
 # db_manager.py
+import itertools
+import threading
+import time
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+import psycopg2.sql
 import config
+from collections import Counter
 
 def sanitize_name(name_str: str) -> str:
     s = name_str.lower().replace(" ", "_").replace("-", "_")
     return "".join(c for c in s if c.isalnum() or c == '_')
 
+# DDL steps already confirmed to be in place in this process. Streamlit reruns
+# every page top to bottom, so the setup functions that check this skip the
+# database entirely after their first successful run.
+_schema_ready = set()
+
+# ==============================================================================
+#                      READ REPLICA ROUTING
+# ==============================================================================
+# Writes always go to the primary (config.DB_PARAMS). Read-only functions call
+# _connect_read(), which hands out a pooled connection to one of the optional
+# read replicas (round-robin). To give read-your-writes, a session that was
+# written in the last config.READ_YOUR_WRITES_SECONDS is read from the primary.
+# Cross-session reads (session lists, search, global totals) always use a
+# replica; a session saved moments ago may show up there a little later. A
+# replica that fails to connect (within config.DB_READ_CONNECT_TIMEOUT) is skipped
+# for config.DB_READ_REPLICA_COOLDOWN seconds instead of being retried on every
+# read. A busy pool is not a failure: the read gets one connection outside the pool.
+
+_read_pools = {}
+_pooled_conns = {}
+_replica_cycle = itertools.cycle(config.DB_READ_REPLICA_DSNS)
+_routing_lock = threading.Lock()
+_recent_writes = {}
+_unhealthy_until = {}
+
+def _mark_written(session_key: tuple):
+    """Records that a session was just written, so its reads stay on the primary for a while."""
+    with _routing_lock:
+        _recent_writes[session_key] = time.monotonic()
+
+def _needs_primary(session_key: tuple = None) -> bool:
+    """True if this session was written recently enough that a replica may not have it yet."""
+    if session_key is None: return False
+    cutoff = time.monotonic() - config.READ_YOUR_WRITES_SECONDS
+    with _routing_lock:
+        for key, written_at in list(_recent_writes.items()):
+            if written_at < cutoff: del _recent_writes[key]
+        return session_key in _recent_writes
+
+def _next_healthy_replica():
+    """Returns the next replica DSN in round-robin order that is not cooling down, or None."""
+    now = time.monotonic()
+    with _routing_lock:
+        for _ in range(len(config.DB_READ_REPLICA_DSNS)):
+            dsn = next(_replica_cycle)
+            if _unhealthy_until.get(dsn, 0) <= now: return dsn
+    return None
+
+def _connect_read(session_key: tuple = None):
+    """Returns a connection for a read-only query, preferring a replica. Release it with _release_read()."""
+    if not config.DB_READ_REPLICA_DSNS or _needs_primary(session_key):
+        return psycopg2.connect(**config.DB_PARAMS)
+    dsn = _next_healthy_replica()
+    if dsn is None:
+        return psycopg2.connect(**config.DB_PARAMS)
+    with _routing_lock:
+        if dsn not in _read_pools:
+            _read_pools[dsn] = psycopg2.pool.ThreadedConnectionPool(
+                0, config.DB_READ_POOL_MAX, dsn, connect_timeout=config.DB_READ_CONNECT_TIMEOUT
+            )
+        pool = _read_pools[dsn]
+    try:
+        try:
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True); conn = pool.getconn()
+        except psycopg2.pool.PoolError:
+            # Every pooled connection is in use: the replica is busy, not down. This one read
+            # gets its own connection, which _release_read() closes.
+            conn = psycopg2.connect(dsn, connect_timeout=config.DB_READ_CONNECT_TIMEOUT)
+            pool = None
+    except psycopg2.OperationalError as e:
+        with _routing_lock:
+            _unhealthy_until[dsn] = time.monotonic() + config.DB_READ_REPLICA_COOLDOWN
+        print(f"⚠️ Read replica unavailable, using the primary for the next {config.DB_READ_REPLICA_COOLDOWN:.0f}s: {e}")
+        return psycopg2.connect(**config.DB_PARAMS)
+    conn.set_session(readonly=True, autocommit=True)
+    if pool is not None:
+        with _routing_lock:
+            _pooled_conns[id(conn)] = pool
+    return conn
+
+def _release_read(conn):
+    """Returns a pooled replica connection to its pool (discarding it if broken), or closes any other connection."""
+    with _routing_lock:
+        pool = _pooled_conns.pop(id(conn), None)
+    if pool is None:
+        conn.close()
+    else:
+        pool.putconn(conn, close=bool(conn.closed))
+
+def get_replica_status() -> list[dict]:
+    """Reports, for each configured replica, whether it is reachable, in recovery, and its replay lag."""
+    status = []
+    for dsn in config.DB_READ_REPLICA_DSNS:
+        conn = None
+        try:
+            conn = psycopg2.connect(dsn, connect_timeout=config.DB_READ_CONNECT_TIMEOUT)
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_is_in_recovery(), EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp());")
+                in_recovery, lag = cur.fetchone()
+            status.append({'dsn': dsn, 'reachable': True, 'in_recovery': in_recovery, 'lag_seconds': lag})
+        except Exception as e:
+            status.append({'dsn': dsn, 'reachable': False, 'error': str(e)})
+        finally:
+            if conn: conn.close()
+    return status
+
 # ==============================================================================
 #                      MIND MAP PROCESSOR FUNCTIONS
 # ==============================================================================
 
+# All Mind Map items live in one hash-partitioned 'mindmap_data' table keyed by
+# session_name (the sanitized session name), with 'mindmap_sessions' as the
+# session registry. Sessions saved before this layout have their own
+# '<session>.diagram_data' schema; the functions below keep reading those
+# "legacy" schemas until migrate_mindmap_schemas() has copied them over.
+
+MINDMAP_DATA_PARTITIONS = 16
+_MINDMAP_DATA_INDEXES = ['mindmap_data_session_category_idx', 'mindmap_data_fts_idx', 'mindmap_data_trgm_idx']
+
+def create_mindmap_data_table():
+    """
+    Creates the session registry and the partitioned mindmap_data table with its indexes.
+    The catalog is checked first, because CREATE INDEX IF NOT EXISTS locks the table and
+    every partition (blocking inserts) before it finds the index already there. Once
+    everything exists, later calls in this process return without touching the database.
+    """
+    if 'mindmap_data' in _schema_ready: return
+    conn = None
+    check_command = """
+    SELECT to_regclass('mindmap_sessions') IS NOT NULL
+       AND (SELECT COUNT(*) FROM pg_inherits WHERE inhparent = to_regclass('mindmap_data')) = %s
+       AND (SELECT COUNT(*) FROM pg_indexes WHERE schemaname = current_schema() AND indexname = ANY(%s)) = %s;
+    """
+    create_command = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    CREATE TABLE IF NOT EXISTS mindmap_sessions (
+        session_name VARCHAR(255) PRIMARY KEY, created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    CREATE TABLE IF NOT EXISTS mindmap_data (
+        id BIGSERIAL, session_name VARCHAR(255) NOT NULL,
+        group_no INTEGER, description TEXT,
+        category_name VARCHAR(255), activity_name VARCHAR(255),
+        legacy_id INTEGER, -- id in the old per-session schema, set by the migration
+        search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(description, ''))) STORED,
+        PRIMARY KEY (session_name, id),
+        UNIQUE (session_name, legacy_id)
+    ) PARTITION BY HASH (session_name);
+    """ + "".join(
+        f"CREATE TABLE IF NOT EXISTS mindmap_data_p{i} PARTITION OF mindmap_data "
+        f"FOR VALUES WITH (MODULUS {MINDMAP_DATA_PARTITIONS}, REMAINDER {i});\n"
+        for i in range(MINDMAP_DATA_PARTITIONS)
+    ) + """
+    CREATE INDEX IF NOT EXISTS mindmap_data_session_category_idx ON mindmap_data (session_name, category_name);
+    CREATE INDEX IF NOT EXISTS mindmap_data_fts_idx ON mindmap_data USING GIN (search_vector);
+    CREATE INDEX IF NOT EXISTS mindmap_data_trgm_idx ON mindmap_data USING GIN (description gin_trgm_ops);
+    """
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            cur.execute(check_command, (MINDMAP_DATA_PARTITIONS, _MINDMAP_DATA_INDEXES, len(_MINDMAP_DATA_INDEXES)))
+            if not cur.fetchone()[0]:
+                cur.execute(create_command)
+                print("✅ 'mindmap_data' table created successfully.")
+        conn.commit()
+        _schema_ready.add('mindmap_data')
+    except Exception as e:
+        print(f"❌ Error while creating 'mindmap_data' table: {e}")
+        if conn: conn.rollback()
+    finally:
+        if conn: conn.close()
+
+def _legacy_mindmap_schemas(cur) -> list[str]:
+    """Lists the old per-session schemas. Uses pg_catalog, which is much cheaper than information_schema."""
+    cur.execute("""
+        SELECT n.nspname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'diagram_data' AND c.relkind = 'r' ORDER BY n.nspname;
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+def _drop_legacy_schema(cur, schema: str):
+    """
+    Drops a legacy session schema. Only names listed by _legacy_mindmap_schemas() are
+    accepted, and a session that lived in 'public' loses just its diagram_data table.
+    """
+    if schema not in _legacy_mindmap_schemas(cur): return
+    if schema == 'public':
+        cur.execute("DROP TABLE public.diagram_data CASCADE;")
+    else:
+        cur.execute(psycopg2.sql.SQL("DROP SCHEMA {} CASCADE;").format(psycopg2.sql.Identifier(schema)))
+
+def _migrated_legacy_id(cur, session_name: str) -> int:
+    """Highest legacy id already copied into mindmap_data for this session (0 if none)."""
+    cur.execute("SELECT COALESCE(MAX(legacy_id), 0) FROM mindmap_data WHERE session_name = %s;", (session_name,))
+    return cur.fetchone()[0]
+
 def setup_mindmap_schema(session_schema_name: str) -> bool:
+    """Registers a Mind Map session. Kept under its old name for existing callers; no schema is created any more."""
     sanitized_name = sanitize_name(session_schema_name)
     if not sanitized_name: return False
     conn = None
     try:
         conn = psycopg2.connect(**config.DB_PARAMS)
-        conn.autocommit = True
         with conn.cursor() as cur:
-            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {sanitized_name};")
-            create_table_sql = f"""
-            CREATE TABLE IF NOT EXISTS {sanitized_name}.diagram_data (
-                id SERIAL PRIMARY KEY, group_no INTEGER, description TEXT,
-                category_name VARCHAR(255), activity_name VARCHAR(255)
-            );"""
-            cur.execute(create_table_sql)
-        print(f"✅ Mind Map schema '{sanitized_name}' ready.")
+            cur.execute("INSERT INTO mindmap_sessions (session_name) VALUES (%s) ON CONFLICT DO NOTHING;", (sanitized_name,))
+        conn.commit(); print(f"✅ Mind Map session '{sanitized_name}' ready.")
+        _mark_written(('mindmap', sanitized_name))
         return True
     except Exception as e:
-        print(f"❌ Error setting up Mind Map schema '{sanitized_name}': {e}")
+        print(f"❌ Error setting up Mind Map session '{sanitized_name}': {e}")
+        if conn: conn.rollback()
         return False
     finally:
         if conn: conn.close()
 
-def insert_mindmap_data(data_list: list[dict], session_schema_name: str, activity_name: str) -> int:
+def insert_mindmap_data(data_list: list[dict], session_schema_name: str, activity_name: str, idempotency_key: str = None) -> int:
+    """
+    Inserts categorized Mind Map items in one batch.
+    When an idempotency_key is given and was already applied, nothing is written
+    again and the call still reports success (used by the write-behind spool).
+    """
     sanitized_name = sanitize_name(session_schema_name)
     if not data_list: return 0
     conn = None
-    sql = f"INSERT INTO {sanitized_name}.diagram_data (group_no, description, category_name, activity_name) VALUES (%s, %s, %s, %s);"
+    sql = "INSERT INTO mindmap_data (session_name, group_no, description, category_name, activity_name) VALUES %s;"
     try:
         conn = psycopg2.connect(**config.DB_PARAMS)
         with conn.cursor() as cur:
-            for row in data_list:
-                cur.execute(sql, (row['group_no'], row['description'], row['category_name'], activity_name))
-        conn.commit(); return len(data_list)
+            if not _claim_idempotency_key(cur, idempotency_key):
+                conn.commit(); return len(data_list)
+            values = [(sanitized_name, row['group_no'], row['description'], row['category_name'], activity_name) for row in data_list]
+            psycopg2.extras.execute_values(cur, sql, values)
+            category_counts = Counter(row['category_name'] for row in data_list)
+            _apply_mindmap_rollups(cur, sanitized_name, category_counts)
+        conn.commit(); _mark_written(('mindmap', sanitized_name))
+        return len(data_list)
     except Exception as e:
         print(f"❌ Error inserting Mind Map data into '{sanitized_name}': {e}")
         if conn: conn.rollback()
@@ -53,43 +259,162 @@ def insert_mindmap_data(data_list: list[dict], session_schema_name: str, activit
         if conn: conn.close()
 
 def get_all_mindmap_sessions() -> list[str]:
+    """Lists registered sessions plus any legacy schemas that have not been migrated yet."""
     conn = None
     try:
-        conn = psycopg2.connect(**config.DB_PARAMS)
+        conn = _connect_read()
         with conn.cursor() as cur:
-            cur.execute("SELECT table_schema FROM information_schema.tables WHERE table_name = 'diagram_data' ORDER BY table_schema")
-            return [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT session_name FROM mindmap_sessions;")
+            sessions = {row[0] for row in cur.fetchall()}
+            sessions.update(_legacy_mindmap_schemas(cur))
+            return sorted(sessions)
     except Exception as e:
         print(f"❌ Error fetching Mind Map sessions: {e}")
         return []
     finally:
-        if conn: conn.close()
+        if conn: _release_read(conn)
 
 def get_mindmap_data_from_schema(session_schema_name: str) -> list[dict]:
+    """
+    Returns a session's items from mindmap_data. If the session still has a legacy
+    schema, rows that have not been migrated yet are read from it as well, so the
+    result is complete at every point of the migration.
+    """
+    sanitized_name = sanitize_name(session_schema_name)
     conn = None; data = []
     try:
-        conn = psycopg2.connect(**config.DB_PARAMS)
+        conn = _connect_read(('mindmap', sanitized_name))
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(f"SELECT * FROM {sanitize_name(session_schema_name)}.diagram_data ORDER BY id;")
+            cur.execute("""
+                SELECT id, group_no, description, category_name, activity_name, legacy_id FROM mindmap_data
+                WHERE session_name = %s ORDER BY legacy_id NULLS LAST, id;
+            """, (sanitized_name,))
+            rows = [dict(row) for row in cur.fetchall()]
+            migrated = [row for row in rows if row['legacy_id'] is not None]
+            new = [row for row in rows if row['legacy_id'] is None]
+            legacy = []
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"{sanitized_name}.diagram_data",))
+            if cur.fetchone()[0]:
+                last_migrated = migrated[-1]['legacy_id'] if migrated else 0
+                cur.execute(f"SELECT * FROM {sanitized_name}.diagram_data WHERE id > %s ORDER BY id;", (last_migrated,))
+                legacy = [dict(row) for row in cur.fetchall()]
+            for row in migrated + new: del row['legacy_id']
+            # Legacy rows predate anything written to mindmap_data, so they come first
+            data = migrated + legacy + new
+    except Exception as e:
+        print(f"❌ Error fetching Mind Map data for session '{session_schema_name}': {e}")
+    finally:
+        if conn: _release_read(conn)
+    return data
+
+def get_all_mindmap_data() -> list[dict]:
+    """Returns every session's items with a 'session' key, in one query plus one per unmigrated legacy schema."""
+    conn = None; data = []
+    try:
+        conn = _connect_read()
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("""
+                SELECT id, group_no, description, category_name, activity_name, session_name AS session
+                FROM mindmap_data ORDER BY session_name, legacy_id NULLS LAST, id;
+            """)
             data = [dict(row) for row in cur.fetchall()]
+            legacy_schemas = _legacy_mindmap_schemas(cur)
     except Exception as e:
-        print(f"❌ Error fetching Mind Map data from schema '{session_schema_name}': {e}")
+        print(f"❌ Error fetching Mind Map data for all sessions: {e}")
+        return data
     finally:
-        if conn: conn.close()
+        if conn: _release_read(conn)
+    if legacy_schemas:
+        # Not-yet-migrated sessions go through the compatibility reader
+        migrated_sessions = {row['session'] for row in data}
+        for schema in legacy_schemas:
+            if schema in migrated_sessions:
+                data = [row for row in data if row['session'] != schema]
+            for row in get_mindmap_data_from_schema(schema):
+                row['session'] = schema
+                data.append(row)
     return data
 
+def _delete_mindmap_session_rows(cur, sanitized_name: str):
+    """Removes a session's rows, registry entry, legacy schema and rollups using the caller's transaction."""
+    cur.execute("DELETE FROM mindmap_data WHERE session_name = %s;", (sanitized_name,))
+    cur.execute("DELETE FROM mindmap_sessions WHERE session_name = %s;", (sanitized_name,))
+    _drop_legacy_schema(cur, sanitized_name)
+    _remove_mindmap_rollups(cur, sanitized_name)
+
 def delete_mindmap_session_schema(session_schema_name: str) -> bool:
+    """Deletes a session's rows, registry entry, rollups and, if it still exists, its legacy schema."""
     sanitized_name = sanitize_name(session_schema_name)
     if not sanitized_name: return False
     conn = None
     try:
         conn = psycopg2.connect(**config.DB_PARAMS)
         with conn.cursor() as cur:
-            cur.execute(f"DROP SCHEMA {sanitized_name} CASCADE;")
-        conn.commit(); print(f"✅ Schema '{sanitized_name}' deleted successfully.")
+            _delete_mindmap_session_rows(cur, sanitized_name)
+        conn.commit(); print(f"✅ Session '{sanitized_name}' deleted successfully.")
+        _mark_written(('mindmap', sanitized_name))
+        return True
+    except Exception as e:
+        print(f"❌ Error deleting session '{sanitized_name}': {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn: conn.close()
+
+def migrate_mindmap_schemas(batch_size: int = 1000, drop_legacy: bool = False) -> bool:
+    """
+    Online migration of the old schema-per-session layout into mindmap_data.
+    Each legacy schema is copied in batches of `batch_size` rows, one short
+    transaction per batch, so the app keeps working while it runs. Progress is
+    tracked through legacy_id, so the tool can be stopped and re-run safely.
+    With drop_legacy=True, a schema is dropped once its row count matches.
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            schemas = _legacy_mindmap_schemas(cur)
+        conn.commit()
+        print(f"ℹ️ Found {len(schemas)} legacy Mind Map schema(s) to migrate.")
+        for schema in schemas:
+            with conn.cursor() as cur:
+                cur.execute("INSERT INTO mindmap_sessions (session_name) VALUES (%s) ON CONFLICT DO NOTHING;", (schema,))
+                last_id = _migrated_legacy_id(cur, schema)
+            conn.commit()
+            copied = 0
+            while True:
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        INSERT INTO mindmap_data (session_name, group_no, description, category_name, activity_name, legacy_id)
+                        SELECT %s, group_no, description, category_name, activity_name, id FROM {schema}.diagram_data
+                        WHERE id > %s ORDER BY id LIMIT %s
+                        ON CONFLICT (session_name, legacy_id) DO NOTHING
+                        RETURNING legacy_id;
+                    """, (schema, last_id, batch_size))
+                    batch_ids = [row[0] for row in cur.fetchall()]
+                conn.commit()
+                if not batch_ids: break
+                last_id = max(batch_ids); copied += len(batch_ids)
+            print(f"✅ '{schema}': copied {copied} row(s).")
+            if drop_legacy:
+                with conn.cursor() as cur:
+                    cur.execute(f"SELECT COUNT(*) FROM {schema}.diagram_data;")
+                    legacy_count = cur.fetchone()[0]
+                    cur.execute("SELECT COUNT(*) FROM mindmap_data WHERE session_name = %s AND legacy_id IS NOT NULL;", (schema,))
+                    if cur.fetchone()[0] == legacy_count:
+                        _drop_legacy_schema(cur, schema)
+                        print(f"🗑️ Legacy schema '{schema}' dropped.")
+                    else:
+                        print(f"⚠️ Row counts differ for '{schema}', keeping the legacy schema.")
+                conn.commit()
+        with conn.cursor() as cur:
+            # The per-session search mirror is superseded by mindmap_data.search_vector
+            if not _legacy_mindmap_schemas(cur):
+                cur.execute("DROP TABLE IF EXISTS mindmap_search_index;")
+        conn.commit()
         return True
     except Exception as e:
-        print(f"❌ Error deleting schema '{sanitized_name}': {e}")
+        print(f"❌ Error migrating Mind Map schemas: {e}")
         if conn: conn.rollback()
         return False
     finally:
@@ -117,25 +442,32 @@ def create_fishbone_table_if_not_exists():
     finally:
         if conn: conn.close()
 
-def insert_fishbone_data(session_name, problem_statement, group_name, verified_data):
-    """Inserts verified fishbone data, including the new row_comment."""
+def insert_fishbone_data(session_name, problem_statement, group_name, verified_data, idempotency_key=None):
+    """
+    Inserts verified fishbone data, including the new row_comment, in one batch.
+    When an idempotency_key is given and was already applied, nothing is written
+    again and the call still reports success (used by the write-behind spool).
+    """
     conn = None
     # --- NEW: Updated SQL statement ---
     sql = """
         INSERT INTO fishbone_data (session_name, problem_statement, group_name, main_cause, sub_cause, detail, row_comment)
-        VALUES (%s, %s, %s, %s, %s, %s, %s);
+        VALUES %s;
     """
     try:
         conn = psycopg2.connect(**config.DB_PARAMS)
         with conn.cursor() as cur:
-            for item in verified_data:
-                # --- NEW: Pass the row_comment to the execute command ---
-                cur.execute(sql, (
-                    session_name, problem_statement, group_name,
-                    item.get('main_cause'), item.get('sub_cause'), item.get('detail'),
-                    item.get('row_comment', '') # Use .get() for safety
-                ))
-        conn.commit()
+            if not _claim_idempotency_key(cur, idempotency_key):
+                conn.commit(); return len(verified_data)
+            # --- NEW: Pass the row_comment with every row ---
+            psycopg2.extras.execute_values(cur, sql, [(
+                session_name, problem_statement, group_name,
+                item.get('main_cause'), item.get('sub_cause'), item.get('detail'),
+                item.get('row_comment', '') # Use .get() for safety
+            ) for item in verified_data])
+            cause_counts = Counter((item.get('main_cause') or '', item.get('sub_cause') or '') for item in verified_data)
+            _apply_fishbone_rollups(cur, session_name, cause_counts)
+        conn.commit(); _mark_written(('fishbone', session_name))
         return len(verified_data)
     except Exception as e:
         print(f"❌ Error inserting fishbone data: {e}")
@@ -144,10 +476,33 @@ def insert_fishbone_data(session_name, problem_statement, group_name, verified_d
     finally:
         if conn: conn.close()
 
-def get_all_fishbone_sessions():
+def copy_fishbone_data(copy_buffer, row_count: int, cause_counts: dict, session_name: str, columns: list[str], idempotency_key: str = None) -> int:
+    """
+    Bulk-loads fishbone rows from a CSV buffer (see fishbone_pipeline.to_copy_buffer)
+    with COPY, updating the rollups in the same transaction. Returns row_count, or 0 on error.
+    """
     conn = None
+    sql = f"COPY fishbone_data ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv);"
     try:
         conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            if not _claim_idempotency_key(cur, idempotency_key):
+                conn.commit(); return row_count
+            cur.copy_expert(sql, copy_buffer)
+            _apply_fishbone_rollups(cur, session_name, cause_counts)
+        conn.commit(); _mark_written(('fishbone', session_name))
+        return row_count
+    except Exception as e:
+        print(f"❌ Error copying fishbone data: {e}")
+        if conn: conn.rollback()
+        return 0
+    finally:
+        if conn: conn.close()
+
+def get_all_fishbone_sessions():
+    conn = None
+    try:
+        conn = _connect_read()
         with conn.cursor() as cur:
             cur.execute("SELECT DISTINCT session_name FROM fishbone_data ORDER BY session_name;")
             return [row[0] for row in cur.fetchall()]
@@ -155,7 +510,7 @@ def get_all_fishbone_sessions():
         print(f"❌ Error fetching fishbone sessions: {e}")
         return []
     finally:
-        if conn: conn.close()
+        if conn: _release_read(conn)
         
 # In db_manager.py, add these three new functions at the end of the Fishbone section
 
@@ -179,8 +534,8 @@ def create_fishbone_sessions_table():
     finally:
         if conn: conn.close()
 
-def save_fishbone_session_comment(session_name: str, comments: str):
-    """Inserts or updates a comment for a given session."""
+def save_fishbone_session_comment(session_name: str, comments: str) -> bool:
+    """Inserts or updates a comment for a given session. Returns True on success."""
     conn = None
     sql = """
         INSERT INTO fishbone_sessions (session_name, comments)
@@ -193,17 +548,37 @@ def save_fishbone_session_comment(session_name: str, comments: str):
             cur.execute(sql, (session_name, comments))
         conn.commit()
         print(f"✅ Comment saved for session '{session_name}'.")
+        _mark_written(('fishbone', session_name))
+        return True
     except Exception as e:
         print(f"❌ Error saving comment for session '{session_name}': {e}")
         if conn: conn.rollback()
+        return False
     finally:
         if conn: conn.close()
 
+def get_fishbone_data(session_name: str) -> list[dict]:
+    """Retrieves all fishbone rows for a session, ordered by main cause and sub cause."""
+    conn = None; data = []
+    try:
+        conn = _connect_read(('fishbone', session_name))
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("""
+                SELECT id, session_name, problem_statement, group_name, main_cause, sub_cause, detail, row_comment
+                FROM fishbone_data WHERE session_name = %s ORDER BY main_cause, sub_cause;
+            """, (session_name,))
+            data = [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        print(f"❌ Error fetching fishbone data for session '{session_name}': {e}")
+    finally:
+        if conn: _release_read(conn)
+    return data
+
 def get_fishbone_session_comment(session_name: str) -> str:
     """Retrieves the comment for a given session."""
     conn = None
     try:
-        conn = psycopg2.connect(**config.DB_PARAMS)
+        conn = _connect_read(('fishbone', session_name))
         with conn.cursor() as cur:
             cur.execute("SELECT comments FROM fishbone_sessions WHERE session_name = %s;", (session_name,))
             result = cur.fetchone()
@@ -212,8 +587,31 @@ def get_fishbone_session_comment(session_name: str) -> str:
         print(f"❌ Error fetching comment for session '{session_name}': {e}")
         return ""
     finally:
-        if conn: conn.close()
+        if conn: _release_read(conn)
         
+def _delete_fishbone_session_rows(cur, session_name: str):
+    """Removes a fishbone session's rows, comment and rollups using the caller's transaction."""
+    cur.execute("DELETE FROM fishbone_data WHERE session_name = %s;", (session_name,))
+    cur.execute("DELETE FROM fishbone_sessions WHERE session_name = %s;", (session_name,))
+    _remove_fishbone_rollups(cur, session_name)
+
+def delete_fishbone_session(session_name: str) -> bool:
+    """Deletes all rows, the session comment and the rollup counts of a fishbone session."""
+    conn = None
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            _delete_fishbone_session_rows(cur, session_name)
+        conn.commit(); print(f"✅ Fishbone session '{session_name}' deleted successfully.")
+        _mark_written(('fishbone', session_name))
+        return True
+    except Exception as e:
+        print(f"❌ Error deleting fishbone session '{session_name}': {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn: conn.close()
+
 def add_comment_column_if_not_exists():
     """
     A one-time migration function to add the 'row_comment' column to the fishbone_data table.
@@ -241,4 +639,613 @@ def add_comment_column_if_not_exists():
         print(f"❌ Error during migration for 'row_comment' column: {e}")
         if conn: conn.rollback()
     finally:
-        if conn: conn.close()
\ No newline at end of file
+        if conn: conn.close()
+
+# ==============================================================================
+#                      ROLLUP (PRE-AGGREGATED COUNT) FUNCTIONS
+# ==============================================================================
+# The rollup tables hold per-session and global counts so the dashboards can
+# chart categories/causes without reading every raw row. They are kept in step
+# with the raw tables inside the same transaction as each insert or delete.
+
+def create_rollup_tables():
+    """Creates the per-session and global rollup tables for both diagram types."""
+    conn = None
+    create_tables_command = """
+    CREATE TABLE IF NOT EXISTS mindmap_category_counts (
+        session_name VARCHAR(255) NOT NULL, category_name VARCHAR(255) NOT NULL,
+        item_count INTEGER NOT NULL,
+        PRIMARY KEY (session_name, category_name)
+    );
+    CREATE TABLE IF NOT EXISTS mindmap_category_totals (
+        category_name VARCHAR(255) PRIMARY KEY, item_count INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS fishbone_cause_counts (
+        session_name VARCHAR(255) NOT NULL, main_cause TEXT NOT NULL,
+        sub_cause TEXT NOT NULL, detail_count INTEGER NOT NULL,
+        PRIMARY KEY (session_name, main_cause, sub_cause)
+    );
+    CREATE TABLE IF NOT EXISTS fishbone_cause_totals (
+        main_cause TEXT PRIMARY KEY, detail_count INTEGER NOT NULL
+    );
+    """
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            cur.execute(create_tables_command)
+        conn.commit(); print("✅ Rollup tables checked/created successfully.")
+    except Exception as e:
+        print(f"❌ Error while creating rollup tables: {e}")
+    finally:
+        if conn: conn.close()
+
+def _apply_mindmap_rollups(cur, session_schema_name: str, category_counts: Counter):
+    """Adds category counts to the mind map rollups using the caller's cursor/transaction."""
+    if not category_counts: return
+    # Sorted (by codepoint, like COLLATE "C") so concurrent writers lock the shared totals rows in the same order
+    rows = sorted((session_schema_name, cat, n) for cat, n in category_counts.items())
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO mindmap_category_counts (session_name, category_name, item_count) VALUES %s
+        ON CONFLICT (session_name, category_name)
+        DO UPDATE SET item_count = mindmap_category_counts.item_count + EXCLUDED.item_count;
+    """, rows)
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO mindmap_category_totals (category_name, item_count) VALUES %s
+        ON CONFLICT (category_name)
+        DO UPDATE SET item_count = mindmap_category_totals.item_count + EXCLUDED.item_count;
+    """, [(cat, n) for _, cat, n in rows])
+
+def _remove_mindmap_rollups(cur, session_schema_name: str):
+    """Subtracts a session's counts from the global totals and drops its per-session rows."""
+    # Lock the shared totals rows in the same (codepoint) order _apply_mindmap_rollups
+    # upserts them, so a delete running next to an insert cannot deadlock
+    cur.execute("""
+        SELECT category_name FROM mindmap_category_totals
+        WHERE category_name IN (SELECT category_name FROM mindmap_category_counts WHERE session_name = %s)
+        ORDER BY category_name COLLATE "C" FOR UPDATE;
+    """, (session_schema_name,))
+    cur.execute("""
+        UPDATE mindmap_category_totals t SET item_count = t.item_count - s.item_count
+        FROM mindmap_category_counts s
+        WHERE s.session_name = %s AND s.category_name = t.category_name;
+    """, (session_schema_name,))
+    cur.execute("""
+        DELETE FROM mindmap_category_totals WHERE item_count <= 0
+        AND category_name IN (SELECT category_name FROM mindmap_category_counts WHERE session_name = %s);
+    """, (session_schema_name,))
+    cur.execute("DELETE FROM mindmap_category_counts WHERE session_name = %s;", (session_schema_name,))
+
+def _apply_fishbone_rollups(cur, session_name: str, cause_counts: Counter):
+    """Adds (main_cause, sub_cause) counts to the fishbone rollups using the caller's cursor/transaction."""
+    if not cause_counts: return
+    # Sorted (by codepoint, like COLLATE "C") so concurrent writers lock the shared totals rows in the same order
+    rows = sorted((session_name, main, sub, n) for (main, sub), n in cause_counts.items())
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO fishbone_cause_counts (session_name, main_cause, sub_cause, detail_count) VALUES %s
+        ON CONFLICT (session_name, main_cause, sub_cause)
+        DO UPDATE SET detail_count = fishbone_cause_counts.detail_count + EXCLUDED.detail_count;
+    """, rows)
+    main_totals = Counter()
+    for (main, _), n in cause_counts.items(): main_totals[main] += n
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO fishbone_cause_totals (main_cause, detail_count) VALUES %s
+        ON CONFLICT (main_cause)
+        DO UPDATE SET detail_count = fishbone_cause_totals.detail_count + EXCLUDED.detail_count;
+    """, sorted(main_totals.items()))
+
+def _remove_fishbone_rollups(cur, session_name: str):
+    """Subtracts a session's counts from the global totals and drops its per-session rows."""
+    # Lock the shared totals rows in the same (codepoint) order _apply_fishbone_rollups
+    # upserts them, so a delete running next to an insert cannot deadlock
+    cur.execute("""
+        SELECT main_cause FROM fishbone_cause_totals
+        WHERE main_cause IN (SELECT main_cause FROM fishbone_cause_counts WHERE session_name = %s)
+        ORDER BY main_cause COLLATE "C" FOR UPDATE;
+    """, (session_name,))
+    cur.execute("""
+        UPDATE fishbone_cause_totals t SET detail_count = t.detail_count - s.detail_count
+        FROM (SELECT main_cause, SUM(detail_count) AS detail_count FROM fishbone_cause_counts
+              WHERE session_name = %s GROUP BY main_cause) s
+        WHERE s.main_cause = t.main_cause;
+    """, (session_name,))
+    cur.execute("""
+        DELETE FROM fishbone_cause_totals WHERE detail_count <= 0
+        AND main_cause IN (SELECT main_cause FROM fishbone_cause_counts WHERE session_name = %s);
+    """, (session_name,))
+    cur.execute("DELETE FROM fishbone_cause_counts WHERE session_name = %s;", (session_name,))
+
+def get_mindmap_category_counts(session_schema_name: str = None) -> list[dict]:
+    """Returns [{'category_name', 'item_count'}] for one session, or global totals when no session is given."""
+    conn = None; data = []
+    try:
+        conn = _connect_read(('mindmap', sanitize_name(session_schema_name)) if session_schema_name else None)
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            if session_schema_name:
+                cur.execute("""
+                    SELECT category_name, item_count FROM mindmap_category_counts
+                    WHERE session_name = %s ORDER BY item_count DESC, category_name;
+                """, (sanitize_name(session_schema_name),))
+            else:
+                cur.execute("SELECT category_name, item_count FROM mindmap_category_totals ORDER BY item_count DESC, category_name;")
+            data = [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        print(f"❌ Error fetching Mind Map category counts: {e}")
+    finally:
+        if conn: _release_read(conn)
+    return data
+
+def get_fishbone_cause_counts(session_name: str = None) -> list[dict]:
+    """
+    Returns [{'main_cause', 'sub_cause', 'detail_count'}] for one session.
+    Without a session, returns global [{'main_cause', 'detail_count'}] totals.
+    """
+    conn = None; data = []
+    try:
+        conn = _connect_read(('fishbone', session_name) if session_name else None)
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            if session_name:
+                cur.execute("""
+                    SELECT main_cause, sub_cause, detail_count FROM fishbone_cause_counts
+                    WHERE session_name = %s ORDER BY main_cause, sub_cause;
+                """, (session_name,))
+            else:
+                cur.execute("SELECT main_cause, detail_count FROM fishbone_cause_totals ORDER BY detail_count DESC, main_cause;")
+            data = [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        print(f"❌ Error fetching fishbone cause counts: {e}")
+    finally:
+        if conn: _release_read(conn)
+    return data
+
+def rebuild_rollups() -> bool:
+    """
+    Recomputes every rollup table from the raw data in a single transaction.
+    Use this to backfill sessions saved before the rollups existed, or to repair drift.
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            cur.execute("""
+                TRUNCATE mindmap_category_counts, mindmap_category_totals,
+                         fishbone_cause_counts, fishbone_cause_totals;
+            """)
+            cur.execute("""
+                INSERT INTO mindmap_category_counts (session_name, category_name, item_count)
+                SELECT session_name, COALESCE(category_name, ''), COUNT(*) FROM mindmap_data
+                GROUP BY session_name, COALESCE(category_name, '');
+            """)
+            # Legacy schemas only contribute the rows the migration has not copied yet
+            for schema in _legacy_mindmap_schemas(cur):
+                last_migrated = _migrated_legacy_id(cur, schema)
+                cur.execute(f"""
+                    INSERT INTO mindmap_category_counts (session_name, category_name, item_count)
+                    SELECT %s, COALESCE(category_name, ''), COUNT(*) FROM {schema}.diagram_data
+                    WHERE id > %s GROUP BY COALESCE(category_name, '')
+                    ON CONFLICT (session_name, category_name)
+                    DO UPDATE SET item_count = mindmap_category_counts.item_count + EXCLUDED.item_count;
+                """, (schema, last_migrated))
+            cur.execute("""
+                INSERT INTO mindmap_category_totals (category_name, item_count)
+                SELECT category_name, SUM(item_count) FROM mindmap_category_counts GROUP BY category_name;
+            """)
+            cur.execute("""
+                INSERT INTO fishbone_cause_counts (session_name, main_cause, sub_cause, detail_count)
+                SELECT session_name, COALESCE(main_cause, ''), COALESCE(sub_cause, ''), COUNT(*) FROM fishbone_data
+                GROUP BY session_name, COALESCE(main_cause, ''), COALESCE(sub_cause, '');
+            """)
+            cur.execute("""
+                INSERT INTO fishbone_cause_totals (main_cause, detail_count)
+                SELECT main_cause, SUM(detail_count) FROM fishbone_cause_counts GROUP BY main_cause;
+            """)
+        conn.commit(); print("✅ Rollup tables rebuilt successfully.")
+        return True
+    except Exception as e:
+        print(f"❌ Error rebuilding rollup tables: {e}")
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn: conn.close()
+
+
+# ==============================================================================
+#                      FULL-TEXT SEARCH FUNCTIONS
+# ==============================================================================
+# Mind map items, fishbone rows and fishbone session comments are searched in
+# place through generated tsvector columns (mindmap_data's are created with the
+# table). Legacy per-session schemas become searchable once migrated. The
+# 'simple' text search config is used because the diagrams mix English and Malay.
+
+_SEARCH_COLUMNS = {
+    'fishbone_data': """to_tsvector('simple', COALESCE(main_cause, '') || ' ' || COALESCE(sub_cause, '') || ' ' ||
+                                  COALESCE(detail, '') || ' ' || COALESCE(row_comment, ''))""",
+    'fishbone_sessions': "to_tsvector('simple', COALESCE(comments, ''))",
+}
+_SEARCH_INDEXES = {
+    'fishbone_data_fts_idx': "fishbone_data USING GIN (search_vector)",
+    'fishbone_data_detail_trgm_idx': "fishbone_data USING GIN (detail gin_trgm_ops)",
+    'fishbone_data_sub_cause_trgm_idx': "fishbone_data USING GIN (sub_cause gin_trgm_ops)",
+    'fishbone_data_row_comment_trgm_idx': "fishbone_data USING GIN (row_comment gin_trgm_ops)",
+    'fishbone_sessions_fts_idx': "fishbone_sessions USING GIN (search_vector)",
+    'fishbone_sessions_comments_trgm_idx': "fishbone_sessions USING GIN (comments gin_trgm_ops)",
+}
+
+def _missing_search_ddl(cur) -> list[str]:
+    """Reads the catalog and returns only the DDL statements for search columns/indexes that do not exist yet."""
+    cur.execute("""
+        SELECT c.relname FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+        WHERE a.attrelid IN (to_regclass('fishbone_data'), to_regclass('fishbone_sessions'))
+          AND a.attname = 'search_vector' AND NOT a.attisdropped;
+    """)
+    have_columns = {row[0] for row in cur.fetchall()}
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND indexname = ANY(%s);", (list(_SEARCH_INDEXES),))
+    have_indexes = {row[0] for row in cur.fetchall()}
+    ddl = [
+        f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({expression}) STORED;"
+        for table, expression in _SEARCH_COLUMNS.items() if table not in have_columns
+    ] + [f"CREATE INDEX {name} ON {target};" for name, target in _SEARCH_INDEXES.items() if name not in have_indexes]
+    return ["CREATE EXTENSION IF NOT EXISTS pg_trgm;"] + ddl if ddl else []
+
+def create_search_indexes():
+    """
+    Creates the fishbone search columns and their GIN/trigram indexes.
+    The catalog is checked first and DDL only runs for what is missing: ALTER TABLE
+    takes an ACCESS EXCLUSIVE lock even when the column already exists. Once
+    everything is in place, later calls in this process return immediately.
+    """
+    if 'search_indexes' in _schema_ready: return
+    conn = None
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT to_regclass('fishbone_sessions') IS NOT NULL AND EXISTS (
+                    SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass('fishbone_data')
+                    AND attname = 'row_comment' AND NOT attisdropped
+                );
+            """)
+            if not cur.fetchone()[0]:
+                # The fishbone tables must exist (with row_comment) before their search columns can be added
+                create_fishbone_table_if_not_exists()
+                create_fishbone_sessions_table()
+                add_comment_column_if_not_exists()
+            ddl = _missing_search_ddl(cur)
+            for statement in ddl:
+                cur.execute(statement)
+        conn.commit()
+        _schema_ready.add('search_indexes')
+        if ddl: print("✅ Search columns and indexes created successfully.")
+    except Exception as e:
+        print(f"❌ Error while creating search indexes: {e}")
+        if conn: conn.rollback()
+    finally:
+        if conn: conn.close()
+
+def search_all(query: str, limit: int = 20, offset: int = 0, fuzzy: bool = False) -> list[dict]:
+    """
+    Searches mind map items, fishbone rows and fishbone session comments in one ranked list.
+    Returns [{'source', 'session_name', 'text', 'context', 'rank'}], best match first.
+    With fuzzy=True, trigram word similarity is used instead of full-text matching,
+    which tolerates typos and partial words.
+    Sessions still in a legacy schema are found through the old mindmap_search_index
+    mirror until migrate-mindmap has copied them, so they never drop out of search.
+    """
+    query = (query or "").strip()
+    if not query: return []
+    if fuzzy:
+        sql = """
+        SELECT * FROM (
+            SELECT 'mindmap' AS source, session_name, description AS text, NULL AS context,
+                   word_similarity(%(q)s, description) AS rank
+            FROM mindmap_data WHERE %(q)s <%% description
+            {legacy_rows}
+            UNION ALL
+            SELECT 'fishbone', session_name, detail, CONCAT_WS(' › ', main_cause, NULLIF(sub_cause, '')),
+                   GREATEST(word_similarity(%(q)s, detail), word_similarity(%(q)s, sub_cause), word_similarity(%(q)s, row_comment))
+            FROM fishbone_data WHERE %(q)s <%% detail OR %(q)s <%% sub_cause OR %(q)s <%% row_comment
+            UNION ALL
+            SELECT 'fishbone_comment', session_name, comments, NULL, word_similarity(%(q)s, comments)
+            FROM fishbone_sessions WHERE %(q)s <%% comments
+        ) results
+        ORDER BY rank DESC, session_name LIMIT %(limit)s OFFSET %(offset)s;
+        """
+        legacy_rows = """
+            UNION ALL
+            SELECT 'mindmap', i.session_name, i.description, NULL, word_similarity(%(q)s, i.description)
+            FROM mindmap_search_index i WHERE i.session_name = ANY(%(legacy)s) AND %(q)s <%% i.description
+              AND NOT EXISTS (SELECT 1 FROM mindmap_data m WHERE m.session_name = i.session_name AND m.legacy_id = i.item_id)
+        """
+    else:
+        sql = """
+        WITH q AS (SELECT websearch_to_tsquery('simple', %(q)s) AS tsq)
+        SELECT * FROM (
+            SELECT 'mindmap' AS source, m.session_name, m.description AS text, NULL AS context,
+                   ts_rank(m.search_vector, q.tsq) AS rank
+            FROM mindmap_data m, q WHERE m.search_vector @@ q.tsq
+            {legacy_rows}
+            UNION ALL
+            SELECT 'fishbone', f.session_name, f.detail, CONCAT_WS(' › ', f.main_cause, NULLIF(f.sub_cause, '')),
+                   ts_rank(f.search_vector, q.tsq)
+            FROM fishbone_data f, q WHERE f.search_vector @@ q.tsq
+            UNION ALL
+            SELECT 'fishbone_comment', s.session_name, s.comments, NULL, ts_rank(s.search_vector, q.tsq)
+            FROM fishbone_sessions s, q WHERE s.search_vector @@ q.tsq
+        ) results
+        ORDER BY rank DESC, session_name LIMIT %(limit)s OFFSET %(offset)s;
+        """
+        legacy_rows = """
+            UNION ALL
+            SELECT 'mindmap', i.session_name, i.description, NULL, ts_rank(i.search_vector, q.tsq)
+            FROM mindmap_search_index i, q WHERE i.search_vector @@ q.tsq AND i.session_name = ANY(%(legacy)s)
+              AND NOT EXISTS (SELECT 1 FROM mindmap_data m WHERE m.session_name = i.session_name AND m.legacy_id = i.item_id)
+        """
+    conn = None; data = []
+    try:
+        conn = _connect_read()
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            legacy = _legacy_mindmap_schemas(cur)
+            cur.execute("SELECT to_regclass('mindmap_search_index') IS NOT NULL;")
+            if not (legacy and cur.fetchone()[0]):
+                legacy_rows = ""
+            cur.execute(sql.format(legacy_rows=legacy_rows), {'q': query, 'limit': limit, 'offset': offset, 'legacy': legacy})
+            data = [dict(row) for row in cur.fetchall()]
+    except Exception as e:
+        print(f"❌ Error searching for '{query}': {e}")
+    finally:
+        if conn: _release_read(conn)
+    return data
+
+
+# ==============================================================================
+#                      IDEMPOTENT WRITE FUNCTIONS
+# ==============================================================================
+# The write-behind spool (write_spool.py) may retry a batch whose commit reached
+# the database but whose acknowledgement was lost. Each batch carries a key that
+# is recorded in the same transaction as its rows, so a retry becomes a no-op.
+
+def create_applied_writes_table() -> bool:
+    """Creates the table that records which idempotency keys have been applied. Returns True once it exists."""
+    if 'applied_writes' in _schema_ready: return True
+    conn = None
+    create_table_command = """
+    CREATE TABLE IF NOT EXISTS applied_writes (
+        idempotency_key VARCHAR(64) PRIMARY KEY,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            cur.execute(create_table_command)
+        conn.commit(); print("✅ 'applied_writes' table checked/created successfully.")
+        _schema_ready.add('applied_writes')
+        return True
+    except Exception as e:
+        print(f"❌ Error while creating 'applied_writes' table: {e}")
+        return False
+    finally:
+        if conn: conn.close()
+
+def _claim_idempotency_key(cur, idempotency_key: str) -> bool:
+    """Records the key in the caller's transaction. Returns False if it was already applied."""
+    if not idempotency_key: return True
+    cur.execute("INSERT INTO applied_writes (idempotency_key) VALUES (%s) ON CONFLICT DO NOTHING;", (idempotency_key,))
+    return cur.rowcount == 1
+
+
+# ==============================================================================
+#                      SESSION SNAPSHOTS (BACKUP / RESTORE / CLONE)
+# ==============================================================================
+# A snapshot is one Arrow IPC file (zstd-compressed) holding a session's rows,
+# with the session kind, name and comments in the schema metadata. Rows leave
+# and enter PostgreSQL through COPY, and the file is written and read through
+# memory maps. pyarrow is only imported here, so the rest of the app runs without it.
+
+SNAPSHOT_FORMAT_VERSION = '1'
+_SNAPSHOT_COLUMNS = {
+    'mindmap': [('group_no', 'int32'), ('description', 'string'), ('category_name', 'string'), ('activity_name', 'string')],
+    'fishbone': [('problem_statement', 'string'), ('group_name', 'string'), ('main_cause', 'string'),
+                 ('sub_cause', 'string'), ('detail', 'string'), ('row_comment', 'string')],
+}
+
+def _snapshot_schema(kind: str):
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in _SNAPSHOT_COLUMNS[kind]])
+
+def _copy_out_to_arrow(cur, query: str, params: tuple, schema):
+    """Runs COPY (query) TO STDOUT as CSV and parses it straight into an Arrow table."""
+    import io
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    buffer = io.BytesIO()
+    cur.copy_expert(f"COPY ({cur.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT csv, HEADER);", buffer)
+    # PostgreSQL writes NULL as an unquoted empty field and '' as "", so keep those apart
+    convert_options = pa_csv.ConvertOptions(
+        column_types=schema, strings_can_be_null=True, quoted_strings_can_be_null=False
+    )
+    return pa_csv.read_csv(pa.BufferReader(buffer.getvalue()), convert_options=convert_options)
+
+def _write_snapshot_file(table, path: str):
+    """Writes the table as a compressed Arrow IPC file through a memory map sized in a dry run."""
+    import pyarrow as pa
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    sizer = pa.MockOutputStream()
+    with pa.ipc.new_file(sizer, table.schema, options=options) as writer:
+        writer.write_table(table)
+    with pa.create_memory_map(path, sizer.size()) as mapped:
+        with pa.ipc.new_file(mapped, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+def read_snapshot(path: str):
+    """Memory-maps a snapshot file and returns (arrow_table, metadata_dict)."""
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    return table, metadata
+
+def _read_session_rows(cur, kind: str, session_name: str):
+    """Copies a session's rows out with the caller's cursor. Returns (session_name, arrow_table, comments)."""
+    schema = _snapshot_schema(kind)
+    columns = ', '.join(schema.names)
+    comments = ''
+    if kind == 'mindmap':
+        session_name = sanitize_name(session_name)
+        query = f"SELECT {columns} FROM mindmap_data WHERE session_name = %s ORDER BY legacy_id NULLS LAST, id"
+        params = (session_name,)
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"{session_name}.diagram_data",))
+        if cur.fetchone()[0]:
+            # Include rows still waiting in a legacy schema
+            # Same order as get_mindmap_data_from_schema: migrated, still-legacy, then new rows
+            query = f"""
+                SELECT {columns} FROM (
+                    SELECT {columns}, CASE WHEN legacy_id IS NULL THEN 3 ELSE 1 END AS sort_group,
+                           COALESCE(legacy_id, id) AS sort_id
+                    FROM mindmap_data WHERE session_name = %s
+                    UNION ALL
+                    SELECT {columns}, 2, id FROM {session_name}.diagram_data
+                    WHERE id > (SELECT COALESCE(MAX(legacy_id), 0) FROM mindmap_data WHERE session_name = %s)
+                ) session_rows ORDER BY sort_group, sort_id
+            """
+            params = (session_name, session_name)
+    elif kind == 'fishbone':
+        query = f"SELECT {columns} FROM fishbone_data WHERE session_name = %s ORDER BY id"
+        params = (session_name,)
+        cur.execute("SELECT comments FROM fishbone_sessions WHERE session_name = %s;", (session_name,))
+        result = cur.fetchone()
+        comments = (result[0] or '') if result else ''
+    else:
+        raise ValueError(f"Unknown session kind: {kind}")
+    return session_name, _copy_out_to_arrow(cur, query, params, schema), comments
+
+def _write_session_snapshot(kind: str, session_name: str, table, comments: str, path: str) -> bool:
+    """Adds the snapshot metadata and writes the file. Returns False when the session is empty."""
+    if table.num_rows == 0 and not comments:
+        print(f"❌ Session '{session_name}' has no data to snapshot.")
+        return False
+    table = table.replace_schema_metadata({
+        'format_version': SNAPSHOT_FORMAT_VERSION, 'kind': kind,
+        'session_name': session_name, 'comments': comments,
+    })
+    _write_snapshot_file(table, path)
+    return True
+
+def snapshot_session(kind: str, session_name: str, path: str) -> int:
+    """
+    Saves a 'mindmap' or 'fishbone' session, including its comments, to an Arrow
+    snapshot file. Returns the number of rows written, or -1 on error.
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        # One snapshot of the database for the rows and the comment
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cur:
+            session_name, table, comments = _read_session_rows(cur, kind, session_name)
+        conn.commit()
+        if not _write_session_snapshot(kind, session_name, table, comments, path):
+            return -1
+        print(f"✅ Snapshot of {kind} session '{session_name}' written to '{path}' ({table.num_rows} rows).")
+        return table.num_rows
+    except Exception as e:
+        print(f"❌ Error creating snapshot of session '{session_name}': {e}")
+        if conn: conn.rollback()
+        return -1
+    finally:
+        if conn: conn.close()
+
+def archive_session(kind: str, session_name: str, path: str) -> int:
+    """
+    Snapshots a session, checks the file reads back complete and deletes the session,
+    all in one transaction. The session's tables are locked in SHARE mode first, so
+    writers wait until the archive commits instead of adding rows that would be
+    deleted without being archived (spooled saves simply retry afterwards).
+    Returns the number of rows archived, or -1 on error (the session is left in place).
+    """
+    conn = None
+    try:
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            if kind == 'mindmap':
+                cur.execute("LOCK TABLE mindmap_data IN SHARE MODE;")
+            elif kind == 'fishbone':
+                cur.execute("LOCK TABLE fishbone_data, fishbone_sessions IN SHARE MODE;")
+            session_name, table, comments = _read_session_rows(cur, kind, session_name)
+            if not _write_session_snapshot(kind, session_name, table, comments, path):
+                conn.rollback(); return -1
+            written, _ = read_snapshot(path)
+            if written.num_rows != table.num_rows:
+                raise ValueError(f"Snapshot '{path}' holds {written.num_rows} rows, expected {table.num_rows}")
+            if kind == 'mindmap':
+                _delete_mindmap_session_rows(cur, session_name)
+            else:
+                _delete_fishbone_session_rows(cur, session_name)
+        conn.commit(); _mark_written((kind, session_name))
+        print(f"✅ {kind.capitalize()} session '{session_name}' archived to '{path}' ({table.num_rows} rows).")
+        return table.num_rows
+    except Exception as e:
+        print(f"❌ Error archiving session '{session_name}': {e}")
+        if conn: conn.rollback()
+        return -1
+    finally:
+        if conn: conn.close()
+
+def restore_session(path: str, session_name: str = None) -> str:
+    """
+    Loads a snapshot file back with COPY, under its original name or under
+    `session_name` (to clone a session). Rollups are updated in the same
+    transaction. Refuses to overwrite an existing session.
+    Returns the restored session name, or None on error.
+    """
+    import io
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    conn = None
+    try:
+        table, metadata = read_snapshot(path)
+        kind = metadata['kind']
+        session_name = session_name or metadata['session_name']
+        if kind == 'mindmap': session_name = sanitize_name(session_name)
+        rows = table.append_column('session_name', pa.array([session_name] * table.num_rows, pa.string()))
+        sink = pa.BufferOutputStream()
+        pa_csv.write_csv(rows, sink)
+        copy_buffer = io.BytesIO(sink.getvalue().to_pybytes())
+        copy_sql = f"COPY {{table}} ({', '.join(rows.schema.names)}) FROM STDIN WITH (FORMAT csv, HEADER);"
+
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        with conn.cursor() as cur:
+            if kind == 'mindmap':
+                cur.execute("""
+                    SELECT EXISTS (SELECT 1 FROM mindmap_sessions WHERE session_name = %s)
+                        OR to_regclass(%s) IS NOT NULL;
+                """, (session_name, f"{session_name}.diagram_data"))
+                if cur.fetchone()[0]: raise ValueError(f"Mind Map session '{session_name}' already exists")
+                cur.execute("INSERT INTO mindmap_sessions (session_name) VALUES (%s);", (session_name,))
+                cur.copy_expert(copy_sql.format(table='mindmap_data'), copy_buffer)
+                counts = pc.value_counts(pc.fill_null(table['category_name'], '')).to_pylist()
+                _apply_mindmap_rollups(cur, session_name, Counter({c['values']: c['counts'] for c in counts}))
+            elif kind == 'fishbone':
+                cur.execute("""
+                    SELECT EXISTS (SELECT 1 FROM fishbone_data WHERE session_name = %s)
+                        OR EXISTS (SELECT 1 FROM fishbone_sessions WHERE session_name = %s);
+                """, (session_name, session_name))
+                if cur.fetchone()[0]: raise ValueError(f"Fishbone session '{session_name}' already exists")
+                cur.copy_expert(copy_sql.format(table='fishbone_data'), copy_buffer)
+                if metadata.get('comments'):
+                    cur.execute("INSERT INTO fishbone_sessions (session_name, comments) VALUES (%s, %s);", (session_name, metadata['comments']))
+                causes = pa.table({
+                    'main_cause': pc.fill_null(table['main_cause'], ''), 'sub_cause': pc.fill_null(table['sub_cause'], ''),
+                }).group_by(['main_cause', 'sub_cause']).aggregate([([], 'count_all')]).to_pylist()
+                _apply_fishbone_rollups(cur, session_name, Counter({(c['main_cause'], c['sub_cause']): c['count_all'] for c in causes}))
+            else:
+                raise ValueError(f"Unknown session kind in snapshot: {kind}")
+        conn.commit(); _mark_written((kind, session_name))
+        print(f"✅ {kind.capitalize()} session '{session_name}' restored from '{path}' ({table.num_rows} rows).")
+        return session_name
+    except Exception as e:
+        print(f"❌ Error restoring snapshot '{path}': {e}")
+        if conn: conn.rollback()
+        return None
+    finally:
+        if conn: conn.close()
@@ -0,0 +1,77 @@
+# fishbone_pipeline.py
+# The verify-to-save path for fishbone data, kept columnar from end to end:
+# normalized AI output -> flat DataFrame -> vectorized validation -> COPY buffer.
+# Used by both the Fishbone Processor page and main.py, and by the write-behind
+# spool when it flushes a fishbone save. db_manager (and with it config) is only
+# imported when saving, so the transforms run without database credentials.
+import csv
+import io
+import numpy as np
+import pandas as pd
+
+# Editable columns shown in the verify grid, and the column order sent to COPY
+FRAME_COLUMNS = ['main_cause', 'sub_cause', 'detail', 'row_comment']
+COPY_COLUMNS = ['session_name', 'problem_statement', 'group_name'] + FRAME_COLUMNS
+
+def flatten_ai_data(ai_data: dict) -> pd.DataFrame:
+    """
+    Flattens a normalized fishbone response (see response_normalizer.normalize_fishbone)
+    into one row per detail, using explode instead of nested Python loops.
+    """
+    causes = pd.DataFrame(ai_data.get('causes', []), columns=['main_cause', 'sub_causes'])
+    subs = causes.explode('sub_causes', ignore_index=True).dropna(subset=['sub_causes'])
+    if subs.empty: return pd.DataFrame(columns=FRAME_COLUMNS)
+    subs = pd.concat([
+        subs['main_cause'].reset_index(drop=True),
+        pd.DataFrame(subs['sub_causes'].tolist(), columns=['sub_cause', 'details']),
+    ], axis=1)
+    rows = subs.explode('details', ignore_index=True).dropna(subset=['details'])
+    frame = rows.rename(columns={'details': 'detail'})[['main_cause', 'sub_cause', 'detail']].reset_index(drop=True)
+    frame['row_comment'] = ''
+    return frame.fillna('')
+
+def _clean_text(column: pd.Series) -> pd.Series:
+    return column.fillna('').astype(str).str.strip()
+
+def _included(df: pd.DataFrame) -> np.ndarray:
+    if 'include' not in df: return np.ones(len(df), dtype=bool)
+    return df['include'].fillna(True).astype(bool).to_numpy()
+
+def validate_frame(df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the positional indices of included rows missing a main cause or a detail.
+    Positions match the rows as shown in the grid, so they can be reported to the user.
+    """
+    missing = (_clean_text(df['main_cause']) == '').to_numpy() | (_clean_text(df['detail']) == '').to_numpy()
+    return np.flatnonzero(missing & _included(df))
+
+def prepare_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the included rows and the savable columns, with blanks instead of missing values."""
+    prepared = df.loc[_included(df)].reindex(columns=FRAME_COLUMNS)
+    return prepared.apply(_clean_text).reset_index(drop=True)
+
+def to_copy_buffer(df: pd.DataFrame, session_name: str, problem_statement: str, group_name: str) -> io.StringIO:
+    """
+    Serializes a prepared frame straight into a CSV buffer for COPY ... FROM STDIN.
+    Every field is quoted, so empty strings stay empty strings instead of NULL.
+    """
+    out = df.assign(session_name=session_name, problem_statement=problem_statement, group_name=group_name or '')
+    buffer = io.StringIO()
+    out[COPY_COLUMNS].to_csv(buffer, header=False, index=False, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    buffer.seek(0)
+    return buffer
+
+def cause_counts(df: pd.DataFrame) -> dict:
+    """{(main_cause, sub_cause): detail_count} for the rollup tables."""
+    if df.empty: return {}
+    counts = df.groupby(['main_cause', 'sub_cause'], sort=False).size()
+    return {key: int(n) for key, n in counts.items()}
+
+def save_fishbone_frame(df: pd.DataFrame, session_name: str, problem_statement: str, group_name: str, idempotency_key: str = None) -> int:
+    """Bulk-loads a prepared frame with COPY. Returns the number of rows saved (0 on error)."""
+    import db_manager
+    if df.empty: return 0
+    buffer = to_copy_buffer(df, session_name, problem_statement, group_name)
+    return db_manager.copy_fishbone_data(
+        buffer, len(df), cause_counts(df), session_name, COPY_COLUMNS, idempotency_key=idempotency_key
+    )
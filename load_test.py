@@ -0,0 +1,337 @@
+# load_test.py
+# Concurrent-user load test for the Streamlit pages, built on streamlit's AppTest.
+#
+# Each simulated facilitator runs in its OWN process (AppTest swaps a global
+# Runtime in and out on every run, so it cannot be shared between threads) through:
+#   Mind Map:  setup -> categorize -> save, then the Mind Map Dashboard
+#   Fishbone:  setup -> verify -> save,     then the Fishbone Dashboard
+# Before opening a dashboard, each user waits until its own saves have been
+# flushed from the write-behind spool, so the session can be selected.
+# Only this parent process runs the spool flusher, as a single Streamlit server would.
+# Gemini is stubbed out (no API calls, no cost), but every database call is real,
+# so point AppSettings.env (or DB_* env vars) at a LOCAL PostgreSQL, never production.
+# The test refuses to start against a non-local host unless --allow-remote is given.
+#
+#   python load_test.py --users 20 --rounds 3 --items 40
+#
+# Reports rerun latency percentiles per step, database connection counts (sampled
+# from pg_stat_activity), memory per simulated-user process and spool drain time.
+# AppTest gives every run a fresh runtime, so st.cache_data never hits: the
+# latencies are uncached, worst-case numbers.
+import argparse
+import ipaddress
+import json
+import multiprocessing
+import os
+import queue
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+# Keep load-test saves out of the real spool file. Set before config is imported;
+# the user processes inherit the variable, so they all share the parent's spool.
+if "LOAD_TEST_SPOOL_PATH" not in os.environ:
+    os.environ["LOAD_TEST_SPOOL_PATH"] = os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "write_spool.db")
+os.environ["WRITE_SPOOL_PATH"] = os.environ["LOAD_TEST_SPOOL_PATH"]
+
+import psycopg2
+from streamlit.testing.v1 import AppTest
+import config
+import db_manager
+import gemini_client
+import response_normalizer
+import write_spool
+
+MINDMAP_PAGE = "pages/1_🧠_Mind_Map_Processor.py"
+FISHBONE_PAGE = "pages/2_🐠_Fishbone_Processor.py"
+MINDMAP_DASHBOARD = "pages/3_📊_Mind_Map_Dashboard.py"
+FISHBONE_DASHBOARD = "pages/4_📈_Fishbone_Dashboard.py"
+RUN_TIMEOUT = 60 # seconds allowed for a single rerun before AppTest gives up
+SAVE_TIMEOUT = 120 # seconds a user waits for its saves to be flushed before opening a dashboard
+
+def build_stub_responses(item_count: int) -> dict:
+    """Canned Gemini responses sized by --items, keyed by prompt file."""
+    mindmap = {
+        "group_name": "K1", "activity_name": "Load Test",
+        "items": [{"description": f"load test idea {i}", "suggested_category": f"Category {i % 5}"} for i in range(item_count)],
+    }
+    fishbone = {
+        "group_name": "Load Test Group", "problem_statement": "Load test problem",
+        "causes": [
+            {"main_cause": f"Cause {c}", "sub_causes": [
+                {"sub_cause": f"Sub {c}.{s}", "details": [f"detail {c}.{s}.{d}" for d in range(4)]}
+                for s in range(max(1, item_count // 16))
+            ]} for c in range(4)
+        ],
+    }
+    return {"prompt.txt": json.dumps(mindmap), "prompt_fishbone.txt": json.dumps(fishbone)}
+
+class SimulatedUser:
+    """One facilitator's flows. Lives in its own process, so it needs no locking."""
+
+    def __init__(self, user: int, item_count: int, run_id: str):
+        self.user = user
+        self.run_id = run_id
+        self.latencies = defaultdict(list)
+        self.errors = []
+        self.skips = []
+        self.mindmap_sessions = set()
+        self.fishbone_sessions = set()
+        self.saved_keys = []
+        stub_responses = build_stub_responses(item_count)
+        gemini_client.get_gemini_response = lambda image_bytes, prompt_filename: stub_responses[prompt_filename]
+        # The parent process flushes the spool; here we only record which jobs our saves created
+        write_spool.start_flusher = lambda: None
+        enqueue = write_spool._enqueue
+        def recording_enqueue(kind, payload):
+            key = enqueue(kind, payload)
+            self.saved_keys.append(key)
+            return key
+        write_spool._enqueue = recording_enqueue
+
+    def _timed(self, step: str, action):
+        start = time.perf_counter()
+        result = action()
+        self.latencies[step].append(time.perf_counter() - start)
+        return result
+
+    def _check(self, at: AppTest, step: str):
+        if at.exception:
+            self.errors.append(f"user {self.user} {step}: {at.exception[0].message}")
+
+    @staticmethod
+    def _button(at: AppTest, label: str):
+        return next(b for b in at.button if b.label == label)
+
+    def _wait_for_saves(self) -> str:
+        """Waits until every save this user made has left the spool. Returns None, or the state of a stuck job."""
+        deadline = time.monotonic() + SAVE_TIMEOUT
+        while self.saved_keys:
+            state = write_spool.get_job_state(self.saved_keys[0])
+            if state is None: self.saved_keys.pop(0); continue
+            if state == 'dead' or time.monotonic() > deadline: return state
+            time.sleep(0.1)
+        return None
+
+    def mindmap_flow(self, round_no: int):
+        session = f"loadtest_{self.run_id}_u{self.user}_r{round_no}"
+        at = AppTest.from_file(MINDMAP_PAGE, default_timeout=RUN_TIMEOUT)
+        self._timed("mindmap: initial render", at.run)
+        # AppTest cannot drive st.file_uploader, so the "Analyze Image" step is
+        # reproduced directly: the same registration + (stubbed) extraction calls
+        def analyze():
+            db_manager.setup_mindmap_schema(session)
+            info, _, _, _ = response_normalizer.extract(
+                lambda: gemini_client.get_gemini_response(b"", "prompt.txt"), 'mindmap'
+            )
+            at.session_state['extracted_data'] = {"session_schema": db_manager.sanitize_name(session), "info": info}
+            at.session_state['stage'] = 'categorize'
+        self._timed("mindmap: analyze", analyze)
+        self._timed("mindmap: categorize render", at.run)
+        self._check(at, "mindmap categorize")
+        # AppTest cannot edit data_editor cells, so categories come from the bulk "use suggestions" tool
+        self._timed("mindmap: bulk categorize", self._button(at, "✨ Use suggestions").click().run)
+        self._check(at, "mindmap bulk categorize")
+        self._timed("mindmap: save", self._button(at, "💾 Save All to Database").click().run)
+        self._check(at, "mindmap save")
+        self.mindmap_sessions.add(db_manager.sanitize_name(session))
+        return session
+
+    def fishbone_flow(self, round_no: int):
+        session = f"loadtest_{self.run_id}_u{self.user}_r{round_no}"
+        at = AppTest.from_file(FISHBONE_PAGE, default_timeout=RUN_TIMEOUT)
+        self._timed("fishbone: initial render", at.run)
+        def analyze():
+            ai_data, _, _, _ = response_normalizer.extract(
+                lambda: gemini_client.get_gemini_response(b"", "prompt_fishbone.txt"), 'fishbone'
+            )
+            at.session_state['fishbone_session_name'] = session
+            at.session_state['fishbone_ai_data'] = ai_data
+            at.session_state['fishbone_stage'] = 'verify'
+        self._timed("fishbone: analyze", analyze)
+        self._timed("fishbone: verify render", at.run)
+        self._check(at, "fishbone verify")
+        self._timed("fishbone: save", self._button(at, "💾 Save All Verified Data").click().run)
+        self._check(at, "fishbone save")
+        self.fishbone_sessions.add(session)
+        return session
+
+    def dashboard_flow(self, page: str, label: str, session: str):
+        # Time from "Save All" returning until the rows are in PostgreSQL (spool flush lag as a user sees it).
+        # The flusher runs in another process, so it also includes up to 1s of its idle polling.
+        stuck_state = self._timed(f"{label}: wait for save", self._wait_for_saves)
+        at = AppTest.from_file(page, default_timeout=RUN_TIMEOUT)
+        self._timed(f"{label}: initial render", at.run)
+        self._check(at, label)
+        if stuck_state:
+            self.skips.append(f"user {self.user} {label}: save still '{stuck_state}' in the spool, session not selected")
+        elif session not in at.sidebar.selectbox[0].options:
+            self.errors.append(f"user {self.user} {label}: session '{session}' missing after its save was flushed")
+        else:
+            self._timed(f"{label}: select session", at.sidebar.selectbox[0].select(session).run)
+            self._check(at, f"{label} select")
+
+    def run_rounds(self, rounds: int):
+        for round_no in range(rounds):
+            try:
+                session = self.mindmap_flow(round_no)
+                self.dashboard_flow(MINDMAP_DASHBOARD, "mindmap dashboard", session)
+                session = self.fishbone_flow(round_no)
+                self.dashboard_flow(FISHBONE_DASHBOARD, "fishbone dashboard", session)
+            except Exception as e:
+                self.errors.append(f"user {self.user} round {round_no}: {e!r}")
+
+def run_user(user: int, rounds: int, item_count: int, run_id: str, start_barrier, results):
+    """Entry point of one simulated-user process. Puts its measurements on the results queue."""
+    sim = SimulatedUser(user, item_count, run_id)
+    rss_start = current_rss_mb()
+    try:
+        start_barrier.wait(timeout=300) # every user starts its first flow at the same moment
+    except threading.BrokenBarrierError:
+        pass # another user process failed to start; run anyway rather than hang
+    started = time.time()
+    sim.run_rounds(rounds)
+    results.put({
+        'latencies': dict(sim.latencies), 'errors': sim.errors, 'skips': sim.skips,
+        'mindmap_sessions': sim.mindmap_sessions, 'fishbone_sessions': sim.fishbone_sessions,
+        'rss_start': rss_start, 'rss_end': current_rss_mb(), 'started': started, 'finished': time.time(),
+        'outcomes': response_normalizer.get_repair_stats(),
+    })
+
+class ConnectionSampler(threading.Thread):
+    """Samples the number of backends connected to the test database every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        conn = psycopg2.connect(**config.DB_PARAMS)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                while not self._stop_event.is_set():
+                    cur.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database();")
+                    self.samples.append(cur.fetchone()[0] - 1) # exclude the sampler itself
+                    self._stop_event.wait(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set(); self.join()
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (Linux /proc, falls back to peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def wait_for_spool(timeout: float) -> float:
+    """Waits until the write-behind spool is empty. Returns the time it took."""
+    start = time.perf_counter()
+    while write_spool.get_spool_status()['depth'] and time.perf_counter() - start < timeout:
+        time.sleep(0.2)
+    return time.perf_counter() - start
+
+def print_report(users: int, item_count: int, results: list[dict], sampler: ConnectionSampler, drain_time: float):
+    latencies, errors, skips, outcomes = defaultdict(list), [], [], Counter()
+    for result in results:
+        for step, values in result['latencies'].items(): latencies[step].extend(values)
+        errors += result['errors']; skips += result['skips']; outcomes.update(result['outcomes'])
+    wall_time = max(r['finished'] for r in results) - min(r['started'] for r in results) if results else 0.0
+    print(f"\n=== Load test: {users} concurrent user(s), {item_count} items per diagram, {wall_time:.1f}s wall time ===\n")
+    print(f"{'step':<36}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, values in sorted(latencies.items()):
+        ms = sorted(v * 1000 for v in values)
+        pct = statistics.quantiles(ms, n=100, method='inclusive') if len(ms) > 1 else ms * 99
+        print(f"{step:<36}{len(ms):>6}{pct[49]:>10.0f}{pct[94]:>10.0f}{pct[98]:>10.0f}{ms[-1]:>10.0f}")
+    if sampler.samples:
+        print(f"\nDB connections: peak {max(sampler.samples)}, mean {statistics.mean(sampler.samples):.1f} ({len(sampler.samples)} samples)")
+    if results:
+        growth = statistics.mean(r['rss_end'] - r['rss_start'] for r in results)
+        print(f"User process RSS: {statistics.mean(r['rss_start'] for r in results):.0f} MB after imports, "
+              f"+{growth:.1f} MB during the flows (mean per user)")
+    status = write_spool.get_spool_status()
+    print(f"Spool drained in {drain_time:.1f}s after the last save ({status['depth']} job(s) still pending, {status['dead']} dead)")
+    print(f"AI response outcomes: {dict(outcomes)}")
+    if len(results) < users:
+        print(f"\n❌ {users - len(results)} user process(es) exited without reporting.")
+    if skips:
+        print(f"\n⚠️ {len(skips)} dashboard selection(s) skipped:")
+        for skip in skips[:20]: print(f"   {skip}")
+    if errors:
+        print(f"\n❌ {len(errors)} error(s):")
+        for error in errors[:20]: print(f"   {error}")
+
+def _remote_hosts() -> list[str]:
+    """Database hosts (primary and read replicas) that are not on this machine."""
+    hosts = [config.DB_PARAMS.get('host') or '']
+    hosts += [psycopg2.extensions.parse_dsn(dsn).get('host', '') for dsn in config.DB_READ_REPLICA_DSNS]
+    remote = []
+    # libpq accepts comma-separated host lists; an empty host or a path is a local unix socket
+    for host in (h.strip() for entry in hosts for h in entry.split(',')):
+        if not host or host.startswith('/') or host == 'localhost': continue
+        try:
+            if ipaddress.ip_address(host).is_loopback: continue
+        except ValueError:
+            pass
+        remote.append(host)
+    return remote
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent facilitators against the Streamlit pages.")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users, one process each (default: 10).")
+    parser.add_argument("--rounds", type=int, default=1, help="Full setup->save->dashboard cycles per user (default: 1).")
+    parser.add_argument("--items", type=int, default=30, help="Items per stubbed mind map / details per fishbone (default: 30).")
+    parser.add_argument("--keep-data", action="store_true", help="Do not delete the load-test sessions afterwards.")
+    parser.add_argument("--allow-remote", action="store_true", help="Run even though the database is not on localhost.")
+    args = parser.parse_args()
+    remote = _remote_hosts()
+    if remote and not args.allow_remote:
+        parser.error(f"refusing to load-test non-local database host(s) {', '.join(remote)}; "
+                     "point DB_HOST at a local PostgreSQL or pass --allow-remote")
+
+    run_id = uuid.uuid4().hex[:8]
+    # Create the tables once up front so the first users don't race on DDL
+    db_manager.create_mindmap_data_table()
+    db_manager.create_rollup_tables()
+    db_manager.create_search_indexes()
+    db_manager.create_applied_writes_table()
+    write_spool.start_flusher()
+
+    ctx = multiprocessing.get_context("spawn")
+    start_barrier, results_queue = ctx.Barrier(args.users), ctx.Queue()
+    processes = [
+        ctx.Process(target=run_user, args=(user, args.rounds, args.items, run_id, start_barrier, results_queue))
+        for user in range(args.users)
+    ]
+    sampler = ConnectionSampler(); sampler.start()
+    for p in processes: p.start()
+    results = []
+    # Drain the queue while waiting, so no process blocks on a full pipe
+    while len(results) < args.users and any(p.is_alive() for p in processes):
+        try:
+            results.append(results_queue.get(timeout=1.0))
+        except queue.Empty:
+            pass
+    while not results_queue.empty(): results.append(results_queue.get())
+    for p in processes: p.join()
+    drain_time = wait_for_spool(timeout=120)
+    sampler.stop()
+
+    print_report(args.users, args.items, results, sampler, drain_time)
+    if not args.keep_data:
+        for result in results:
+            for session in result['mindmap_sessions']: db_manager.delete_mindmap_session_schema(session)
+            for session in result['fishbone_sessions']: db_manager.delete_fishbone_session(session)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import argparse
 import os
 import re
 import sys
+import config
 import gemini_client
 import db_manager
+import fishbone_pipeline
+import response_normalizer
+import write_spool
 
 def get_kumpulan_number(group_name_str: str) -> int:
     """Extracts the integer group number from a string, with a user-input fallback."""
@@ -99,13 +104,181 @@ def main():
 
     print(f"\n🎉 Session '{session_name_input}' (schema: '{session_schema}') processing complete.")
 
+def rebuild_rollups_command(args):
+    """Backfills the rollup count tables from the raw data."""
+    db_manager.create_mindmap_data_table()
+    db_manager.create_rollup_tables()
+    if not db_manager.rebuild_rollups():
+        sys.exit(1)
+
+def migrate_mindmap_command(args):
+    """Copies the old per-session Mind Map schemas into the partitioned mindmap_data table."""
+    db_manager.create_mindmap_data_table()
+    if not db_manager.migrate_mindmap_schemas(batch_size=args.batch_size, drop_legacy=args.drop_legacy):
+        sys.exit(1)
+
+def check_replicas_command(args):
+    """Prints the reachability and replay lag of each configured read replica."""
+    status = db_manager.get_replica_status()
+    if not status:
+        print("ℹ️ No read replicas configured (DB_READ_REPLICA_DSNS is empty). All reads use the primary.")
+        return
+    for replica in status:
+        if not replica['reachable']:
+            print(f"❌ {replica['dsn']}: unreachable ({replica['error']})")
+        elif not replica['in_recovery']:
+            print(f"⚠️ {replica['dsn']}: reachable but NOT in recovery; this looks like a primary, not a replica.")
+        else:
+            lag = replica['lag_seconds']
+            print(f"✅ {replica['dsn']}: replaying, lag {'unknown' if lag is None else f'{lag:.1f}s'}")
+
+def repair_report_command(args):
+    """Measures how many saved AI responses the normalizer can recover without a new AI call."""
+    report = response_normalizer.evaluate_corpus(args.corpus_dir)
+    if not report:
+        print(f"ℹ️ No 'mindmap/' or 'fishbone/' response folders found in '{args.corpus_dir}'.")
+        return
+    for kind, result in report.items():
+        outcomes = result['outcomes']
+        total = sum(outcomes.values())
+        recovered = total - outcomes['unrecoverable']
+        print(f"\n--- {kind} ({total} responses) ---")
+        for outcome in response_normalizer.OUTCOMES:
+            print(f"{outcome:>18}: {outcomes[outcome]}")
+        print(f"{'recovery rate':>18}: {recovered / total:.1%}" if total else "")
+        for name, recorded, outcome in result['changed']:
+            print(f"⚠️ {name}: recorded as '{recorded}', now '{outcome}'")
+    if any(result['changed'] for result in report.values()):
+        sys.exit(1)
+
+def fishbone_command(args):
+    """Extracts one or more fishbone images into a session, using the same pipeline as the Streamlit page."""
+    db_manager.create_fishbone_table_if_not_exists()
+    db_manager.create_fishbone_sessions_table()
+    db_manager.add_comment_column_if_not_exists()
+    db_manager.create_rollup_tables()
+    db_manager.create_applied_writes_table()
+    total = 0
+    for img_path in args.images:
+        if not os.path.exists(img_path):
+            print(f"❌ Image file not found at: {img_path}"); continue
+        with open(img_path, "rb") as f:
+            image_bytes = f.read()
+        print(f"\n⏳ Processing image: {img_path} for session: {args.session}")
+        ai_data, outcome, problems, _ = response_normalizer.extract(
+            lambda: gemini_client.get_gemini_response(image_bytes, 'prompt_fishbone.txt'), 'fishbone'
+        )
+        if ai_data is None:
+            print(f"❌ Extraction failed: {' '.join(problems)}"); continue
+        frame = fishbone_pipeline.flatten_ai_data(ai_data)
+        failing_rows = fishbone_pipeline.validate_frame(frame)
+        if len(failing_rows):
+            print(f"⚠️ Skipping {len(failing_rows)} row(s) without a main cause or detail.")
+            frame = frame.drop(index=frame.index[failing_rows])
+        saved = fishbone_pipeline.save_fishbone_frame(
+            fishbone_pipeline.prepare_frame(frame), args.session,
+            ai_data.get('problem_statement', ''), ai_data.get('group_name', '')
+        )
+        print(f"✅ {saved} detail(s) saved{' (response was repaired)' if outcome == 'repaired' else ''}.")
+        total += saved
+    if args.comments:
+        db_manager.save_fishbone_session_comment(args.session, args.comments)
+    print(f"\n🎉 Session '{args.session}' complete: {total} detail(s) saved from {len(args.images)} image(s).")
+
+def _ensure_tables():
+    db_manager.create_mindmap_data_table()
+    db_manager.create_fishbone_table_if_not_exists()
+    db_manager.create_fishbone_sessions_table()
+    db_manager.add_comment_column_if_not_exists()
+    db_manager.create_rollup_tables()
+
+def init_db_command(args):
+    """
+    Creates every table, search column and index up front, so the pages never have to run DDL.
+    Any legacy per-session Mind Map schemas are copied into mindmap_data as part of the deploy.
+    """
+    _ensure_tables()
+    db_manager.create_search_indexes()
+    db_manager.create_applied_writes_table()
+    if not db_manager.migrate_mindmap_schemas():
+        sys.exit(1)
+
+def snapshot_command(args):
+    """Writes a session to an Arrow snapshot file, leaving the live data in place."""
+    if db_manager.snapshot_session(args.kind, args.session, args.path) < 0:
+        sys.exit(1)
+
+def archive_command(args):
+    """Snapshots a session, checks the file reads back complete, then removes the session from the database."""
+    queued = write_spool.count_session_jobs(args.kind, args.session)
+    if queued:
+        sys.exit(f"❌ {queued} spooled save(s) for session '{args.session}' have not been written yet. "
+                 "Let the spool drain (or retry its dead jobs) before archiving.")
+    if db_manager.archive_session(args.kind, args.session, args.path) < 0:
+        sys.exit(1)
+    print(f"📦 Session '{args.session}' archived to '{args.path}'.")
+
+def restore_command(args):
+    """Loads a snapshot file back into the database, optionally under a new session name (clone)."""
+    _ensure_tables()
+    if not db_manager.restore_session(args.path, session_name=args.as_session):
+        sys.exit(1)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Diagram processor command line tools.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    init_parser = subparsers.add_parser("init-db", help="Create all tables, search columns and indexes (run once per deployment).")
+    init_parser.set_defaults(func=init_db_command)
+
+    rebuild_parser = subparsers.add_parser("rebuild-rollups", help="Recompute the category/cause rollup tables from raw data.")
+    rebuild_parser.set_defaults(func=rebuild_rollups_command)
+
+    migrate_parser = subparsers.add_parser("migrate-mindmap", help="Copy per-session Mind Map schemas into the single mindmap_data table.")
+    migrate_parser.add_argument("--batch-size", type=int, default=1000, help="Rows copied per transaction (default: 1000).")
+    migrate_parser.add_argument("--drop-legacy", action="store_true", help="Drop each legacy schema once its rows are verified.")
+    migrate_parser.set_defaults(func=migrate_mindmap_command)
+
+    replicas_parser = subparsers.add_parser("check-replicas", help="Show reachability and replication lag of the read replicas.")
+    replicas_parser.set_defaults(func=check_replicas_command)
+
+    report_parser = subparsers.add_parser("repair-report", help="Measure AI response repair coverage over a saved corpus.")
+    report_parser.add_argument("corpus_dir", nargs="?", default=config.AI_RESPONSE_CORPUS_DIR, help="Folder with mindmap/ and fishbone/ response files (e.g. samples/ai_responses).")
+    report_parser.set_defaults(func=repair_report_command)
+
+    fishbone_parser = subparsers.add_parser("fishbone", help="Extract fishbone diagram image(s) into a session.")
+    fishbone_parser.add_argument("session", help="Session name to save the details under.")
+    fishbone_parser.add_argument("images", nargs="+", help="One or more image files (batch mode).")
+    fishbone_parser.add_argument("--comments", default="", help="Optional session comment.")
+    fishbone_parser.set_defaults(func=fishbone_command)
+
+    for name, func, help_text in [
+        ("snapshot", snapshot_command, "Save a session to an Arrow snapshot file (backup)."),
+        ("archive", archive_command, "Save a session to a snapshot file, then remove it from the database."),
+    ]:
+        snap_parser = subparsers.add_parser(name, help=help_text)
+        snap_parser.add_argument("kind", choices=["mindmap", "fishbone"], help="Session type.")
+        snap_parser.add_argument("session", help="Session name.")
+        snap_parser.add_argument("path", help="Snapshot file to write (e.g. archive/q1_marketing.arrow).")
+        snap_parser.set_defaults(func=func)
+
+    restore_parser = subparsers.add_parser("restore", help="Load a snapshot file back into the database.")
+    restore_parser.add_argument("path", help="Snapshot file to read.")
+    restore_parser.add_argument("--as", dest="as_session", help="Restore under a different session name (clone).")
+    restore_parser.set_defaults(func=restore_command)
+    return parser
+
 if __name__ == "__main__":
+    args = build_parser().parse_args()
     try:
-        main()
+        if args.command:
+            args.func(args)
+        else:
+            main()
     except (ValueError, FileNotFoundError) as e:
         # Catch configuration or file errors from config.py
         print(e)
         sys.exit(1)
     except KeyboardInterrupt:
         print("\n👋 Process interrupted by user. Exiting.")
-        sys.exit(0)
\ No newline at end of file
+        sys.exit(0)
@@ -1,10 +1,13 @@
 # pages/1_🧠_Mind_Map_Processor.py
 import streamlit as st
+import pandas as pd
 import db_manager
 import gemini_client
+import response_normalizer
+import spool_status
+import write_spool
 import re
 from PIL import Image
-import json
 
 def get_kumpulan_number(group_name_str: str) -> int:
     if group_name_str:
@@ -14,6 +17,16 @@ def get_kumpulan_number(group_name_str: str) -> int:
 
 st.set_page_config(page_title="Mind Map Processor", page_icon="🧠", layout="centered")
 
+db_manager.create_mindmap_data_table()
+# Rollup counts are updated in the same transaction as every insert
+db_manager.create_rollup_tables()
+
+# --- Write-Behind Spool Status ---
+# Saves go to a local spool first and are flushed to the database in the background.
+write_spool.start_flusher()
+with st.sidebar:
+    spool_status.show_spool_status()
+
 # --- State Management ---
 if 'stage' not in st.session_state: st.session_state.stage = 'setup'
 if 'extracted_data' not in st.session_state: st.session_state.extracted_data = {}
@@ -21,7 +34,7 @@ if 'extracted_data' not in st.session_state: st.session_state.extracted_data = {
 def reset_to_setup():
     st.session_state.stage = 'setup'
     st.session_state.extracted_data = {}
-    for key in ['activity_name', 'group_name', 'session_name']:
+    for key in ['activity_name', 'group_name', 'session_name', 'category_grid', 'category_grid_version', 'bulk_category']:
         if key in st.session_state: del st.session_state[key]
 
 # --- STAGE 1: SETUP ---
@@ -40,19 +53,21 @@ if st.session_state.stage == 'setup':
         else:
             with st.spinner("Processing..."):
                 if not db_manager.setup_mindmap_schema(session_name):
-                    st.error(f"❌ Failed to set up database schema '{session_name}'. Check DB connection.")
+                    st.error(f"❌ Failed to set up database session '{session_name}'. Check DB connection.")
                 else:
                     image_bytes = uploaded_image.getvalue()
-                    json_string = gemini_client.get_gemini_response(image_bytes, "prompt.txt")
-                    try:
-                        extracted_info = json.loads(json_string)
-                        if 'items' not in extracted_info: raise ValueError("Missing 'items' key in AI response")
+                    # Malformed responses are repaired locally; the AI is only called again if that fails
+                    extracted_info, outcome, problems, json_string = response_normalizer.extract(
+                        lambda: gemini_client.get_gemini_response(image_bytes, "prompt.txt"), 'mindmap'
+                    )
+                    if extracted_info is None:
+                        st.error(f"❌ AI Extraction Failed: {' '.join(problems)} Try a clearer image.")
+                        st.code(json_string, language='json')
+                    else:
+                        if outcome == 'repaired': st.toast("ℹ️ The AI response had minor format problems and was repaired automatically.")
                         st.session_state.extracted_data = {"session_schema": db_manager.sanitize_name(session_name), "info": extracted_info}
                         st.session_state.stage = 'categorize'
                         st.rerun()
-                    except (json.JSONDecodeError, ValueError) as e:
-                        st.error(f"❌ AI Extraction Failed: {e}. Try a clearer image.")
-                        st.code(json_string, language='json')
 
 # --- STAGE 2: CATEGORIZATION ---
 elif st.session_state.stage == 'categorize':
@@ -66,47 +81,96 @@ elif st.session_state.stage == 'categorize':
     st.session_state.activity_name = st.text_input("Activity Name", info.get('activity_name', 'N/A'))
     st.session_state.group_name = st.text_input("Group Name", info.get('group_name', 'N/A'))
     
-    # Form for editing and categorizing
-    with st.form("category_form"):
-        st.markdown("---")
-        st.markdown("###### Items to Categorize")
-        
-        # This list will hold the data for each row in the form
-        processed_items = []
-        
-        for i, item in enumerate(items):
-            with st.container(border=True):
-                col1, col2 = st.columns(2)
-                # Get the description from the AI
-                desc = col1.text_input("Description", value=item.get('description', ''), key=f"desc_{i}")
-                # Provide a simple text box for the category
-                cat = col2.text_input("Category", key=f"cat_{i}")
-                processed_items.append({'description': desc, 'category': cat})
-        
-        submitted = st.form_submit_button("💾 Save All to Database", use_container_width=True)
-
-    if submitted:
-        # Validate that all fields are filled
-        if not all(item['description'] and item['category'] for item in processed_items):
-            st.warning("⚠️ Please fill in all descriptions and categories before saving.")
+    # One data_editor grid instead of two text inputs per item: the rerun cost
+    # and the number of widgets stay flat however long the list is.
+    if 'category_grid' not in st.session_state:
+        st.session_state.category_grid = pd.DataFrame({
+            'select': False,
+            'description': [item.get('description', '') for item in items],
+            'suggested_category': [item.get('suggested_category') or '' for item in items],
+            'category': '',
+        })
+    if 'category_grid_version' not in st.session_state: st.session_state.category_grid_version = 0
+
+    def update_grid(new_grid):
+        # A new editor key drops the old editor's pending edits, which are already in new_grid
+        st.session_state.category_grid = new_grid.reset_index(drop=True)
+        st.session_state.category_grid_version += 1
+        st.rerun()
+
+    st.markdown("---")
+    st.markdown("###### Items to Categorize")
+    edited_grid = st.data_editor(
+        st.session_state.category_grid,
+        column_config={
+            "select": st.column_config.CheckboxColumn("Select", default=False),
+            "description": st.column_config.TextColumn("Description", required=True),
+            "suggested_category": st.column_config.TextColumn("Suggested"),
+            "category": st.column_config.TextColumn("Category", required=True),
+        },
+        disabled=["suggested_category"], num_rows="dynamic", hide_index=True,
+        use_container_width=True, key=f"category_grid_{st.session_state.category_grid_version}"
+    )
+    selected = edited_grid['select'].fillna(False).astype(bool)
+
+    # --- Bulk Tools ---
+    with st.container(border=True):
+        col_cat, col_apply = st.columns([3, 1], vertical_alignment="bottom")
+        bulk_category = col_cat.text_input(f"Category for the {int(selected.sum())} selected row(s)", key="bulk_category")
+        if col_apply.button("Apply to selected", disabled=not (selected.any() and bulk_category.strip()), use_container_width=True):
+            edited_grid.loc[selected, 'category'] = bulk_category.strip()
+            edited_grid['select'] = False
+            update_grid(edited_grid)
+
+        col_fill, col_suggest, col_group = st.columns(3)
+        if col_fill.button("⬇️ Fill down", help="Copy each category into the empty rows below it.", use_container_width=True):
+            categories = edited_grid['category'].fillna('').astype(str).str.strip()
+            edited_grid['category'] = categories.mask(categories == '').ffill().fillna('')
+            update_grid(edited_grid)
+        if col_suggest.button("✨ Use suggestions", help="Fill empty categories with the suggested category.", use_container_width=True):
+            categories = edited_grid['category'].fillna('').astype(str).str.strip()
+            edited_grid['category'] = categories.mask(categories == '', edited_grid['suggested_category'].fillna(''))
+            update_grid(edited_grid)
+        if col_group.button("🗂️ Group by suggestion", help="Sort rows so items with the same suggestion sit together.", use_container_width=True):
+            update_grid(edited_grid.sort_values('suggested_category', kind='stable'))
+
+    # Direct edits live in the editor's own widget state; category_grid is only
+    # replaced by the bulk tools above (with a fresh editor key)
+
+    if st.button("💾 Save All to Database", type="primary", use_container_width=True):
+        # Validate the whole grid at once and point at the rows that need attention
+        descriptions = edited_grid['description'].fillna('').astype(str).str.strip()
+        categories = edited_grid['category'].fillna('').astype(str).str.strip()
+        no_description = descriptions == ''
+        no_category = (categories == '') & ~no_description
+        if edited_grid.empty:
+            st.error("❌ There is nothing to save.")
+        elif no_description.any() or no_category.any():
+            # The grid has no row numbers, so rows are named by their description
+            problems = []
+            if no_category.any():
+                names = ', '.join(f"'{d[:40]}{'…' if len(d) > 40 else ''}'" for d in descriptions[no_category].head(10))
+                problems.append(f"add a category for {names}{' ...' if no_category.sum() > 10 else ''}")
+            if no_description.any():
+                problems.append(f"fill in or delete the {int(no_description.sum())} row(s) without a description")
+            st.warning(f"⚠️ Please {' and '.join(problems)}.")
         else:
             with st.spinner("Saving..."):
                 kumpulan_no = get_kumpulan_number(st.session_state.group_name)
                 # Prepare data for insertion
-                data_to_insert = [
-                    {'group_no': kumpulan_no, 'description': item['description'], 'category_name': item['category']}
-                    for item in processed_items
-                ]
-                # Call the correct insert function
-                records_inserted = db_manager.insert_mindmap_data(data_to_insert, schema, st.session_state.activity_name)
-                
-                if records_inserted > 0:
-                    st.success(f"✅ Success! {records_inserted} records saved.")
+                data_to_insert = pd.DataFrame({
+                    'group_no': kumpulan_no, 'description': descriptions, 'category_name': categories
+                }).to_dict('records')
+                # Spool the records locally; the background flusher writes them to the database
+                try:
+                    write_spool.enqueue_mindmap_data(data_to_insert, schema, st.session_state.activity_name)
+                except Exception as e:
+                    st.error(f"❌ Could not save the records locally: {e}")
+                else:
+                    st.success(f"✅ Success! {len(data_to_insert)} records saved. They will sync to the database in the background.")
                     st.balloons()
                     reset_to_setup() # Reset the state for the next use
                     st.rerun()
-                else:
-                    st.error("❌ No records were inserted. An error occurred.")
 
     if st.button("❌ Start Over"):
         reset_to_setup()
@@ -1,9 +1,11 @@
 # pages/2_🐠_Fishbone_Processor.py
 import streamlit as st
-import pandas as pd
-import json
 import db_manager
+import fishbone_pipeline
 import gemini_client
+import response_normalizer
+import spool_status
+import write_spool
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Fishbone Processor", page_icon="🐠", layout="wide")
@@ -14,6 +16,14 @@ st.markdown("---")
 db_manager.create_fishbone_table_if_not_exists()
 db_manager.create_fishbone_sessions_table()
 db_manager.add_comment_column_if_not_exists()
+db_manager.create_rollup_tables()
+db_manager.create_search_indexes()
+
+# --- Write-Behind Spool Status ---
+# Saves go to a local spool first and are flushed to the database in the background.
+write_spool.start_flusher()
+with st.sidebar:
+    spool_status.show_spool_status()
 
 
 # --- State Management ---
@@ -30,21 +40,6 @@ def reset_to_setup():
 
 initialize_state()
 
-# --- Helper Function ---
-def flatten_ai_data(ai_data):
-    flat_list = []
-    if 'causes' not in ai_data: return []
-    for cause_group in ai_data.get('causes', []):
-        main_cause = cause_group.get('main_cause', '')
-        sub_causes_list = cause_group.get('sub_causes', [{'sub_cause': '', 'details': cause_group.get('details', [])}])
-        if not sub_causes_list: sub_causes_list = [{'sub_cause': '', 'details': cause_group.get('details', [])}]
-
-        for sub_group in sub_causes_list:
-            sub_cause = sub_group.get('sub_cause', '')
-            for detail in sub_group.get('details', []):
-                flat_list.append({'main_cause': main_cause, 'sub_cause': sub_cause, 'detail': detail})
-    return flat_list
-
 # --- STAGE 1: SETUP ---
 if st.session_state.fishbone_stage == 'setup':
     st.header("Step 1: Upload Your Diagram")
@@ -53,16 +48,19 @@ if st.session_state.fishbone_stage == 'setup':
     if st.button("🧠 Process with AI", disabled=(not session_name or not uploaded_file)):
         with st.spinner("The AI is analyzing your diagram..."):
             image_bytes = uploaded_file.getvalue()
-            json_string = gemini_client.get_gemini_response(image_bytes, 'prompt_fishbone.txt')
-            try:
-                ai_data = json.loads(json_string)
+            # Malformed responses are repaired locally; the AI is only called again if that fails
+            ai_data, outcome, problems, json_string = response_normalizer.extract(
+                lambda: gemini_client.get_gemini_response(image_bytes, 'prompt_fishbone.txt'), 'fishbone'
+            )
+            if ai_data is None:
+                st.error(f"AI Extraction Failed. Error: {' '.join(problems)} The AI may have returned an invalid format.")
+                st.code(json_string, language='json')
+            else:
+                if outcome == 'repaired': st.toast("ℹ️ The AI response had minor format problems and was repaired automatically.")
                 st.session_state.fishbone_session_name = session_name
                 st.session_state.fishbone_ai_data = ai_data
                 st.session_state.fishbone_stage = 'verify'
                 st.rerun()
-            except (json.JSONDecodeError, KeyError) as e:
-                st.error(f"AI Extraction Failed. Error: {e}. The AI may have returned an invalid format.")
-                st.code(json_string, language='json')
 
 # --- STAGE 2: VERIFY & EDIT ---
 elif st.session_state.fishbone_stage == 'verify':
@@ -77,10 +75,8 @@ elif st.session_state.fishbone_stage == 'verify':
     session_comments = st.text_area("Session Comments (Optional)", height=100)
 
     if 'fishbone_editable_df' not in st.session_state:
-        df_temp = pd.DataFrame(flatten_ai_data(ai_data))
-        df_temp = df_temp.fillna('')
-        df_temp['row_comment'] = '' # Initialize the comment column
-        st.session_state.fishbone_editable_df = df_temp
+        # One row per detail, with an empty comment column to fill in
+        st.session_state.fishbone_editable_df = fishbone_pipeline.flatten_ai_data(ai_data)
     
     st.subheader("Causal Details")
     
@@ -101,32 +97,37 @@ elif st.session_state.fishbone_stage == 'verify':
 
     col_save, col_reset = st.columns(2)
     if col_save.button("💾 Save All Verified Data", type="primary", use_container_width=True):
-        df_to_save = edited_df[edited_df['include'] == True] if 'include' in edited_df else edited_df
-        is_valid = all(row['main_cause'] and row['detail'] for index, row in df_to_save.iterrows())
+        failing_rows = fishbone_pipeline.validate_frame(edited_df)
         
-        if not is_valid:
-            st.warning("⚠️ For all included rows, please ensure 'Main Cause' and 'Detail' are filled.")
+        if len(failing_rows):
+            # Report the index labels shown in the grid's left column (0-based, and kept when rows are deleted)
+            rows = ', '.join(str(label) for label in edited_df.index[failing_rows[:20]])
+            st.warning(f"⚠️ For all included rows, please ensure 'Main Cause' and 'Detail' are filled. Check row(s): {rows}{' ...' if len(failing_rows) > 20 else ''}.")
         else:
             with st.spinner("Saving data and comments..."):
-                db_manager.save_fishbone_session_comment(st.session_state.fishbone_session_name, session_comments)
-                records_to_insert = df_to_save.drop(columns=['include'], errors='ignore').to_dict('records')
-                records_inserted = db_manager.insert_fishbone_data(
-                    session_name=st.session_state.fishbone_session_name,
-                    problem_statement=problem_statement, group_name=group_name,
-                    verified_data=records_to_insert
-                )
-                if records_inserted > 0 or session_comments:
-                    st.session_state.fishbone_stage = 'saved'
-                    st.rerun()
+                df_to_save = fishbone_pipeline.prepare_frame(edited_df)
+                if df_to_save.empty and not session_comments:
+                    st.error("❌ There is nothing to save.")
                 else:
-                    st.error("❌ No records were saved to the database.")
+                    # Spool locally; the background flusher COPYs rows and saves the comment
+                    try:
+                        write_spool.enqueue_fishbone_frame(
+                            session_name=st.session_state.fishbone_session_name,
+                            problem_statement=problem_statement, group_name=group_name,
+                            frame=df_to_save, session_comments=session_comments
+                        )
+                    except Exception as e:
+                        st.error(f"❌ Could not save the data locally: {e}")
+                    else:
+                        st.session_state.fishbone_stage = 'saved'
+                        st.rerun()
     
     if col_reset.button("❌ Start Over", use_container_width=True):
         reset_to_setup(); st.rerun()
 
 # --- STAGE 3: SAVED ---
 elif st.session_state.fishbone_stage == 'saved':
-    st.success("✅ Success! All data has been saved to the database.")
+    st.success("✅ Success! All data has been saved and will sync to the database in the background.")
     st.balloons()
     st.write("You can now view this data in the 'Fishbone Dashboard' or process another diagram.")
     if st.button("Process Another Diagram"):
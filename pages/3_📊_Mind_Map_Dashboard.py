@@ -7,18 +7,6 @@ st.set_page_config(page_title="Mind Map Dashboard", page_icon="📊", layout="wi
 st.title("📊 Mind Map Dashboard")
 st.markdown("View and filter data from all Mind Map & List sessions.")
 
-# --- Helper function to get data from all schemas ---
-def get_all_mindmap_data_from_all_schemas() -> list[dict]:
-    """Fetches all data from all mind map schemas and adds a 'session' column."""
-    all_data = []
-    session_schemas = db_manager.get_all_mindmap_sessions()
-    for schema in session_schemas:
-        schema_data = db_manager.get_mindmap_data_from_schema(schema)
-        for row in schema_data:
-            row['session'] = schema # Add the session name to each row
-            all_data.append(row)
-    return all_data
-
 # --- Sidebar Filters ---
 st.sidebar.header("Filters")
 # --- THIS IS THE FIX ---
@@ -45,23 +33,34 @@ if selected_session != "All Sessions":
 
 # --- Load and Display Data ---
 # --- THIS IS THE NEW LOGIC ---
+# Across all sessions the category counts come from the rollup tables, so the chart
+# never needs the raw rows. A single session's rows are loaded anyway, so it is counted from them.
 if selected_session == "All Sessions":
     st.markdown("### Displaying Data for: `All Sessions`")
-    data = get_all_mindmap_data_from_all_schemas()
+    category_counts = db_manager.get_mindmap_category_counts()
+    # Reading every row is expensive, so only do it when the user asks for the rows.
+    data = db_manager.get_all_mindmap_data() if st.checkbox("Load all raw rows") else []
 else:
     st.markdown(f"### Data for Session: `{selected_session}`")
     data = db_manager.get_mindmap_data_from_schema(selected_session)
+    category_counts = (
+        pd.DataFrame(data)['category_name'].fillna('').value_counts()
+        .rename_axis('category_name').reset_index(name='item_count').to_dict('records')
+    ) if data else []
 
-if not data:
-    st.warning(f"No data found for selection.")
-else:
+if data:
     df = pd.DataFrame(data)
-    
     # Display the dataframe. If 'All Sessions' is selected, it will have the 'session' column.
     st.dataframe(df, use_container_width=True)
+elif selected_session != "All Sessions":
+    st.warning(f"No data found for selection.")
 
-    # --- Simple Chart ---
-    st.markdown("---")
-    st.markdown("#### Category Counts")
-    if 'category_name' in df.columns:
-        st.bar_chart(df['category_name'].value_counts())
\ No newline at end of file
+# --- Simple Chart ---
+st.markdown("---")
+st.markdown("#### Category Counts")
+if category_counts:
+    st.bar_chart(pd.DataFrame(category_counts).set_index('category_name')['item_count'])
+elif selected_session == "All Sessions":
+    st.info("No category counts yet. Run `python main.py rebuild-rollups` to backfill older sessions.")
+else:
+    st.info("No items to count for this session.")
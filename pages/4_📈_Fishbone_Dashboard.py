@@ -10,17 +10,8 @@ st.markdown("---")
 # This is a helper function to get data from the database. It's good practice.
 @st.cache_data(ttl=600) # Cache the data for 10 minutes to make the app faster
 def get_fishbone_data(session_name):
-    conn = None
-    try:
-        conn = db_manager.psycopg2.connect(**db_manager.config.DB_PARAMS)
-        query = "SELECT * FROM fishbone_data WHERE session_name = %s ORDER BY main_cause, sub_cause;"
-        df = pd.read_sql_query(query, conn, params=(session_name,))
-        return df
-    except Exception as e:
-        st.error(f"Error fetching data: {e}")
-        return pd.DataFrame()
-    finally:
-        if conn: conn.close()
+    # db_manager routes this read to a replica when one is configured
+    return pd.DataFrame(db_manager.get_fishbone_data(session_name))
 
 # --- Sidebar Filters ---
 st.sidebar.header("Dashboard Filters")
@@ -89,4 +80,13 @@ if selected_session:
             main_cause_counts = df_metrics[df_metrics['main_cause'] != 'N/A']['main_cause'].value_counts()
             st.bar_chart(main_cause_counts)
         else:
-            st.info("No data to visualize for the current filter.")
\ No newline at end of file
+            st.info("No data to visualize for the current filter.")
+
+# --- Cross-Session Overview (served from the rollup totals) ---
+st.markdown("---")
+with st.expander("🌐 Main Causes Across All Sessions"):
+    totals = pd.DataFrame(db_manager.get_fishbone_cause_counts())
+    if not totals.empty:
+        st.bar_chart(totals[totals['main_cause'] != ''].set_index('main_cause')['detail_count'])
+    else:
+        st.info("No totals yet. Run `python main.py rebuild-rollups` to backfill older sessions.")
@@ -0,0 +1,64 @@
+# pages/5_🔎_Search.py
+import streamlit as st
+import pandas as pd
+import db_manager
+
+st.set_page_config(page_title="Search", page_icon="🔎", layout="wide")
+st.title("🔎 Search All Sessions")
+st.markdown("Find every Mind Map item, Fishbone detail or comment that mentions a topic, across all sessions.")
+
+PAGE_SIZE = 25
+SOURCE_LABELS = {
+    'mindmap': "🧠 Mind Map item",
+    'fishbone': "🐠 Fishbone detail",
+    'fishbone_comment': "📝 Fishbone session comment",
+}
+
+# Cache identical searches briefly so paging back and forth doesn't hit the database again
+@st.cache_data(ttl=60)
+def run_search(query, page, fuzzy):
+    return db_manager.search_all(query, limit=PAGE_SIZE, offset=page * PAGE_SIZE, fuzzy=fuzzy)
+
+# --- Search Form ---
+col_query, col_fuzzy = st.columns([4, 1])
+query = col_query.text_input("Search for:", placeholder='e.g. staff turnover, "late delivery", -holiday')
+fuzzy = col_fuzzy.toggle("Fuzzy match", help="Tolerate typos and partial words (trigram similarity).")
+
+if 'search_page' not in st.session_state: st.session_state.search_page = 0
+# Go back to the first page whenever the search changes
+if st.session_state.get('search_last') != (query, fuzzy):
+    st.session_state.search_last = (query, fuzzy)
+    st.session_state.search_page = 0
+
+if not query.strip():
+    st.info("Type a word or phrase above to search.")
+    st.stop()
+
+# --- Results ---
+results = run_search(query, st.session_state.search_page, fuzzy)
+
+if not results:
+    st.warning("No matches found." if st.session_state.search_page == 0 else "No more results.")
+else:
+    start = st.session_state.search_page * PAGE_SIZE
+    st.markdown(f"Showing results {start + 1}–{start + len(results)}")
+    df = pd.DataFrame(results)
+    df['source'] = df['source'].map(SOURCE_LABELS)
+    st.dataframe(
+        df[['session_name', 'source', 'text', 'context', 'rank']],
+        column_config={
+            "session_name": "Session",
+            "source": "Found In",
+            "text": "Text",
+            "context": "Main Cause › Sub Cause",
+            "rank": st.column_config.NumberColumn("Relevance", format="%.3f"),
+        },
+        hide_index=True, use_container_width=True
+    )
+
+# --- Pagination ---
+col_prev, col_next = st.columns(2)
+if col_prev.button("⬅️ Previous", disabled=st.session_state.search_page == 0, use_container_width=True):
+    st.session_state.search_page -= 1; st.rerun()
+if col_next.button("Next ➡️", disabled=len(results) < PAGE_SIZE, use_container_width=True):
+    st.session_state.search_page += 1; st.rerun()
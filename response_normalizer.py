@@ -0,0 +1,366 @@
+# response_normalizer.py
+# Turns the raw text returned by Gemini into the exact shapes the processor
+# pages expect, so a slightly malformed answer does not cost another AI call.
+#
+#   1. JSON repair   - code fences, prose around the object, trailing commas and
+#                      truncated output (unclosed strings/arrays/objects).
+#   2. Normalization - absorbs the structural variants the model produces
+#                      (missing 'items', bare strings, 'details' on a main cause...).
+#   3. Validation    - a response is only "unrecoverable" if, after 1 and 2,
+#                      it still has no usable items/causes.
+#
+# samples/ai_responses/ is a small labelled corpus: each file name ends in the
+# outcome it should get, so `python main.py repair-report samples/ai_responses`
+# doubles as a regression check for the repairer and normalizers.
+import json
+import os
+import time
+from collections import Counter
+import config
+
+MAX_EXTRACTION_ATTEMPTS = 2 # the first call plus one retry, used only for unrecoverable responses
+
+OUTCOMES = ('clean', 'json_repaired', 'schema_normalized', 'unrecoverable')
+# Outcome counters for this process
+_stats = Counter()
+
+# ==============================================================================
+#                      JSON REPAIR
+# ==============================================================================
+
+class StreamingJsonRepairer:
+    """
+    Single-pass, incremental JSON repairer. Feed it text chunks as they arrive,
+    then call finish() to get a string that json.loads can parse.
+    It tracks string/escape state and the open bracket stack, drops trailing
+    commas, ignores anything before the first '{'/'[' (e.g. ```json fences or
+    prose) and after the top-level value closes, and closes whatever a truncated
+    response left open.
+    """
+
+    def __init__(self):
+        self._out = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._done = False
+        # (output length, stack copy) at each top-level-safe comma; used to cut back a dangling fragment
+        self._cut_points = []
+
+    def feed(self, chunk: str):
+        for ch in chunk:
+            if self._done: return
+            if not self._started:
+                if ch in '{[':
+                    self._started = True
+                else:
+                    continue
+            if self._in_string:
+                self._out.append(ch)
+                if self._escape: self._escape = False
+                elif ch == '\\': self._escape = True
+                elif ch == '"': self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._out.append(ch)
+            elif ch in '{[':
+                self._stack.append('}' if ch == '{' else ']')
+                self._out.append(ch)
+            elif ch in '}]':
+                self._strip_trailing_comma()
+                if self._stack: self._stack.pop()
+                self._out.append(ch)
+                if not self._stack: self._done = True
+            elif ch == ',':
+                self._cut_points.append((len(self._out), list(self._stack)))
+                self._out.append(ch)
+            else:
+                self._out.append(ch)
+
+    def _strip_trailing_comma(self):
+        i = len(self._out) - 1
+        while i >= 0 and self._out[i].isspace(): i -= 1
+        if i >= 0 and self._out[i] == ',':
+            del self._out[i:]
+
+    @staticmethod
+    def _close(text: str, stack: list) -> str:
+        text = text.rstrip()
+        if text.endswith(','): text = text[:-1]
+        # A value-less key ("key": or "key":  ) cannot be completed, so give it null
+        if text.endswith(':'): text += ' null'
+        return text + ''.join(reversed(stack))
+
+    def finish(self) -> str:
+        """Returns the repaired JSON text. Falls back to cutting at earlier commas if needed."""
+        text = ''.join(self._out)
+        if self._done or not self._started: return text
+        if self._in_string:
+            # Drop a dangling escape so the closing quote is not swallowed
+            if self._escape: text = text[:-1]
+            text += '"'
+        candidate = self._close(text, self._stack)
+        try:
+            json.loads(candidate); return candidate
+        except json.JSONDecodeError:
+            pass
+        # The tail is a fragment (e.g. half a key); cut back to the last comma that still parses
+        for position, stack in reversed(self._cut_points):
+            candidate = self._close(text[:position], stack)
+            try:
+                json.loads(candidate); return candidate
+            except json.JSONDecodeError:
+                continue
+        return candidate
+
+def repair_json(text: str) -> str:
+    """Convenience wrapper: repairs a complete response string in one go."""
+    repairer = StreamingJsonRepairer()
+    repairer.feed(text or '')
+    return repairer.finish()
+
+def parse_json(text: str):
+    """Returns (parsed_value, was_repaired). parsed_value is None if the text cannot be recovered."""
+    try:
+        return json.loads(text), False
+    except (json.JSONDecodeError, TypeError):
+        pass
+    try:
+        return json.loads(repair_json(text)), True
+    except json.JSONDecodeError:
+        return None, True
+
+# ==============================================================================
+#                      SCHEMA NORMALIZATION & VALIDATION
+# ==============================================================================
+
+def _text(value) -> str:
+    return '' if value is None else str(value).strip()
+
+def _first_key(d: dict, *keys):
+    for key in keys:
+        if key in d: return d[key]
+    return None
+
+def normalize_mindmap(data) -> dict:
+    """
+    Coerces a mind map response to {'group_name', 'activity_name', 'items': [{'description', ...}]}.
+    Accepts a bare list of items, alternative list keys, bare string items and
+    alternative description keys.
+    """
+    if isinstance(data, list): data = {'items': data}
+    if not isinstance(data, dict): return {'group_name': '', 'activity_name': '', 'items': []}
+    raw_items = _first_key(data, 'items', 'Items', 'ideas', 'points', 'list')
+    if raw_items is None:
+        # Fall back to the first list in the object, if any
+        raw_items = next((v for v in data.values() if isinstance(v, list)), [])
+    items = []
+    for raw in raw_items if isinstance(raw_items, list) else []:
+        if isinstance(raw, dict):
+            item = dict(raw)
+            item['description'] = _text(_first_key(raw, 'description', 'text', 'item', 'idea', 'name'))
+        else:
+            item = {'description': _text(raw)}
+        if item['description']: items.append(item)
+    return {
+        **{k: v for k, v in data.items() if k not in ('items', 'Items', 'ideas', 'points', 'list')},
+        'group_name': _text(data.get('group_name')),
+        'activity_name': _text(_first_key(data, 'activity_name', 'activity', 'topic', 'title')),
+        'items': items,
+    }
+
+def _normalize_details(raw) -> list[str]:
+    if raw is None: return []
+    if not isinstance(raw, list): raw = [raw]
+    details = []
+    for d in raw:
+        text = _text(_first_key(d, 'detail', 'text', 'description') if isinstance(d, dict) else d)
+        if text: details.append(text)
+    return details
+
+def normalize_fishbone(data) -> dict:
+    """
+    Coerces a fishbone response to
+    {'group_name', 'problem_statement', 'causes': [{'main_cause', 'sub_causes': [{'sub_cause', 'details': [str]}]}]}.
+    Absorbs 'details' placed directly on a main cause, missing/empty 'sub_causes',
+    bare string sub-causes and details, and a bare list of causes.
+    """
+    if isinstance(data, list): data = {'causes': data}
+    if not isinstance(data, dict): return {'group_name': '', 'problem_statement': '', 'causes': []}
+    causes = []
+    raw_causes = _first_key(data, 'causes', 'categories', 'bones')
+    for raw in raw_causes if isinstance(raw_causes, list) else []:
+        if not isinstance(raw, dict): continue
+        main_cause = _text(_first_key(raw, 'main_cause', 'category', 'name', 'cause'))
+        sub_causes = []
+        raw_subs = raw.get('sub_causes')
+        for sub in raw_subs if isinstance(raw_subs, list) else []:
+            if isinstance(sub, dict):
+                sub_causes.append({
+                    'sub_cause': _text(_first_key(sub, 'sub_cause', 'name', 'cause')),
+                    'details': _normalize_details(sub.get('details', sub.get('detail'))),
+                })
+            elif _text(sub):
+                sub_causes.append({'sub_cause': _text(sub), 'details': []})
+        # Details attached straight to the main cause become a sub-cause-less group
+        direct_details = _normalize_details(raw.get('details', raw.get('detail')))
+        if direct_details:
+            sub_causes.append({'sub_cause': '', 'details': direct_details})
+        if main_cause or sub_causes:
+            causes.append({'main_cause': main_cause, 'sub_causes': sub_causes})
+    return {
+        'group_name': _text(data.get('group_name')),
+        'problem_statement': _text(_first_key(data, 'problem_statement', 'problem', 'effect')),
+        'causes': causes,
+    }
+
+def validate_mindmap(data: dict) -> list[str]:
+    """Returns a list of problems with a normalized mind map; empty means usable."""
+    problems = []
+    if not data.get('items'): problems.append("No items with a description were found.")
+    return problems
+
+def validate_fishbone(data: dict) -> list[str]:
+    """Returns a list of problems with a normalized fishbone; empty means usable."""
+    problems = []
+    if not data.get('causes'):
+        problems.append("No causes were found.")
+    elif not any(sub['details'] for cause in data['causes'] for sub in cause['sub_causes']):
+        problems.append("No cause has any details.")
+    return problems
+
+def fill_optional_mindmap(data):
+    """
+    Fills the fields the mind map prompt lets the model omit or null (group_name, activity_name)
+    and trims text, the same way normalize_mindmap does, without fixing anything structural.
+    A response that follows the prompt comes out equal to its normalized form.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list): return data
+    return {
+        **data,
+        'group_name': _text(data.get('group_name')),
+        'activity_name': _text(data.get('activity_name')),
+        'items': [
+            {**item, 'description': _text(item.get('description'))} if isinstance(item, dict) else item
+            for item in data['items']
+        ],
+    }
+
+def fill_optional_fishbone(data):
+    """
+    Fills the fields the fishbone prompt lets the model omit or null (group_name, problem_statement,
+    sub_causes, details) and trims text, the same way normalize_fishbone does, without fixing
+    anything structural. A response that follows the prompt comes out equal to its normalized form.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('causes'), list): return data
+    def fill_sub(sub):
+        if not isinstance(sub, dict): return sub
+        details = sub.get('details', [])
+        return {**sub, 'sub_cause': _text(sub.get('sub_cause')),
+                'details': [_text(d) if isinstance(d, str) else d for d in details] if isinstance(details, list) else details}
+    def fill_cause(cause):
+        if not isinstance(cause, dict): return cause
+        sub_causes = cause.get('sub_causes', [])
+        return {**cause, 'main_cause': _text(cause.get('main_cause')),
+                'sub_causes': [fill_sub(sub) for sub in sub_causes] if isinstance(sub_causes, list) else sub_causes}
+    return {
+        **data,
+        'group_name': _text(data.get('group_name')),
+        'problem_statement': _text(data.get('problem_statement')),
+        'causes': [fill_cause(cause) for cause in data['causes']],
+    }
+
+# kind -> (normalize, validate, fill_optional)
+_NORMALIZERS = {
+    'mindmap': (normalize_mindmap, validate_mindmap, fill_optional_mindmap),
+    'fishbone': (normalize_fishbone, validate_fishbone, fill_optional_fishbone),
+}
+
+# ==============================================================================
+#                      ENTRY POINTS
+# ==============================================================================
+
+def _process(raw_text: str, kind: str) -> tuple:
+    """Like process_response, but the outcome distinguishes 'json_repaired' from 'schema_normalized'."""
+    normalize, validate, fill_optional = _NORMALIZERS[kind]
+    parsed, json_repaired = parse_json(raw_text)
+    if parsed is None:
+        return None, 'unrecoverable', ["The response is not valid JSON and could not be repaired."]
+    if isinstance(parsed, dict) and 'error' in parsed and len(parsed) <= 2:
+        # gemini_client reports HTTP/API failures as {"error": ..., "details": ...}
+        return None, 'unrecoverable', [f"The AI request failed: {parsed['error']}"]
+    data = normalize(parsed)
+    problems = validate(data)
+    if problems: return None, 'unrecoverable', problems
+    if json_repaired: return data, 'json_repaired', []
+    # Only a structural fix counts as a repair; nulls and omissions the prompt allows do not
+    return data, ('clean' if data == fill_optional(parsed) else 'schema_normalized'), []
+
+def process_response(raw_text: str, kind: str) -> tuple:
+    """
+    Repairs, normalizes and validates one AI response of the given kind ('mindmap' or 'fishbone').
+    Returns (data, outcome, problems): outcome is 'clean', 'repaired' or 'unrecoverable',
+    and data is None only when unrecoverable.
+    """
+    data, outcome, problems = _process(raw_text, kind)
+    return data, ('repaired' if outcome in ('json_repaired', 'schema_normalized') else outcome), problems
+
+def _record(raw_text: str, kind: str, outcome: str):
+    _stats[outcome] += 1
+    # Keep every response that needed help, to grow the evaluation corpus
+    if outcome != 'clean' and config.AI_RESPONSE_CORPUS_DIR:
+        try:
+            folder = os.path.join(config.AI_RESPONSE_CORPUS_DIR, kind)
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f"{time.time_ns()}_{outcome}.txt"), "w", encoding="utf-8") as f:
+                f.write(raw_text or '')
+        except OSError as e:
+            print(f"⚠️ Could not save AI response to the corpus: {e}")
+
+def extract(fetch_response, kind: str) -> tuple:
+    """
+    Calls fetch_response() (which returns Gemini's raw text) and processes the result.
+    The call is repeated only while the response is unrecoverable, up to
+    MAX_EXTRACTION_ATTEMPTS in total. Returns (data, outcome, problems, raw_text).
+    """
+    for _ in range(MAX_EXTRACTION_ATTEMPTS):
+        raw_text = fetch_response()
+        data, outcome, problems = _process(raw_text, kind)
+        _record(raw_text, kind, outcome)
+        if outcome != 'unrecoverable': break
+    if outcome in ('json_repaired', 'schema_normalized'): outcome = 'repaired'
+    return data, outcome, problems, raw_text
+
+def get_repair_stats() -> dict:
+    """Returns the outcome counts seen by this process."""
+    return dict(_stats)
+
+def _recorded_outcome(filename: str):
+    """The outcome encoded in a corpus file name ('<anything>_<outcome>.txt'), or None."""
+    stem = os.path.splitext(filename)[0]
+    return next((outcome for outcome in OUTCOMES if stem.endswith(f"_{outcome}")), None)
+
+def evaluate_corpus(corpus_dir: str) -> dict:
+    """
+    Runs every saved response under corpus_dir/<kind>/ through the normalizer, so repair
+    coverage can be measured offline. Returns {kind: {'outcomes': Counter, 'changed': [...]}}
+    where 'changed' lists (file name, recorded outcome, current outcome) for files whose
+    name records a different outcome (a regression, or a newly handled variant).
+    """
+    if not corpus_dir:
+        raise ValueError("❌ ERROR: No corpus folder given. Pass one, or set AI_RESPONSE_CORPUS_DIR in your AppSettings.env file.")
+    report = {}
+    for kind in _NORMALIZERS:
+        folder = os.path.join(corpus_dir, kind)
+        if not os.path.isdir(folder): continue
+        outcomes, changed = Counter(), []
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), encoding="utf-8") as f:
+                outcome = _process(f.read(), kind)[1]
+            outcomes[outcome] += 1
+            recorded = _recorded_outcome(name)
+            if recorded and recorded != outcome: changed.append((name, recorded, outcome))
+        report[kind] = {'outcomes': outcomes, 'changed': changed}
+    return report
@@ -0,0 +1,20 @@
+# spool_status.py
+# Sidebar widget shared by the processor pages: the state of the write-behind
+# spool (write_spool.py), refreshed every few seconds without rerunning the page.
+import streamlit as st
+import config
+import write_spool
+
+@st.fragment(run_every=5)
+def show_spool_status():
+    status = write_spool.get_spool_status()
+    col_depth, col_lag = st.columns(2)
+    col_depth.metric("Pending saves", status['depth'])
+    col_lag.metric("Flush lag", f"{status['lag_seconds']:.0f}s")
+    if status['failing']:
+        st.warning(f"⚠️ {status['failing']} save(s) waiting to retry: {status['last_error']}")
+    if status['dead']:
+        st.error(f"❌ {status['dead']} save(s) were NOT written after {config.WRITE_SPOOL_MAX_ATTEMPTS} attempts: {status['dead_error']}")
+        if st.button("🔁 Retry failed saves"):
+            write_spool.retry_dead_jobs()
+            st.rerun(scope="fragment")
@@ -0,0 +1,247 @@
+# write_spool.py
+# A small write-behind layer between the processor pages and PostgreSQL.
+# "Save All" appends the verified records to a local SQLite spool (durable once
+# the call returns) and a background thread drains the spool into the database,
+# retrying with backoff. Every job carries an idempotency key that db_manager
+# records in the same transaction as the rows, so retries never duplicate data.
+# A job that still fails after config.WRITE_SPOOL_MAX_ATTEMPTS is parked as
+# "dead": it stays in the spool, is no longer retried, and is shown in the sidebar
+# until retry_dead_jobs() puts it back in the queue.
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import pandas as pd
+import config
+import db_manager
+import fishbone_pipeline
+
+_flusher_thread = None
+_flusher_lock = threading.Lock()
+_wake_event = threading.Event()
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(config.WRITE_SPOOL_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=FULL;") # fsync on every commit, so an acknowledged save survives a crash
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS spool (
+            idempotency_key TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,
+            enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT
+        );
+    """)
+    # Newest applied fishbone job per session, so a retried older job cannot overwrite a newer comment
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS applied_sessions (
+            session_name TEXT PRIMARY KEY, enqueued_at REAL NOT NULL
+        );
+    """)
+    return conn
+
+def _enqueue(kind: str, payload: dict) -> str:
+    key = uuid.uuid4().hex
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO spool (idempotency_key, kind, payload, enqueued_at) VALUES (?, ?, ?, ?);",
+                (key, kind, json.dumps(payload), time.time())
+            )
+    finally:
+        conn.close()
+    _wake_event.set()
+    return key
+
+def enqueue_mindmap_data(data_list: list[dict], session_schema_name: str, activity_name: str) -> str:
+    """Durably spools a Mind Map save. Returns the job's idempotency key."""
+    return _enqueue('mindmap', {
+        'data_list': data_list, 'session_schema_name': session_schema_name, 'activity_name': activity_name
+    })
+
+def enqueue_fishbone_data(session_name, problem_statement, group_name, verified_data, session_comments='') -> str:
+    """Durably spools a Fishbone save (rows plus the session comment). Returns the job's idempotency key."""
+    return _enqueue('fishbone', {
+        'session_name': session_name, 'problem_statement': problem_statement, 'group_name': group_name,
+        'verified_data': verified_data, 'session_comments': session_comments
+    })
+
+def enqueue_fishbone_frame(session_name, problem_statement, group_name, frame, session_comments='') -> str:
+    """
+    Durably spools a Fishbone save from a prepared DataFrame (see fishbone_pipeline.prepare_frame).
+    The rows are stored column by column, so no per-row dicts are built.
+    """
+    return _enqueue('fishbone_columns', {
+        'session_name': session_name, 'problem_statement': problem_statement, 'group_name': group_name,
+        'columns': frame.to_dict('list'), 'session_comments': session_comments
+    })
+
+def _apply_job(kind: str, payload: dict, key: str, apply_comment: bool = True) -> bool:
+    """
+    Writes one spooled job to PostgreSQL. Returns True once it is safely applied.
+    apply_comment=False skips the session comment (a newer job for the session already set it).
+    """
+    if kind == 'mindmap':
+        # Nothing to write (every row was deleted in the grid); done rather than failing forever
+        if not payload['data_list']: return True
+        if not db_manager.setup_mindmap_schema(payload['session_schema_name']): return False
+        return db_manager.insert_mindmap_data(
+            payload['data_list'], payload['session_schema_name'], payload['activity_name'], idempotency_key=key
+        ) > 0
+    if kind == 'fishbone':
+        # The comment upsert is idempotent on its own, so it is safe to repeat on retry
+        if apply_comment and payload['session_comments'] and not db_manager.save_fishbone_session_comment(payload['session_name'], payload['session_comments']):
+            return False
+        if not payload['verified_data']: return True
+        return db_manager.insert_fishbone_data(
+            payload['session_name'], payload['problem_statement'], payload['group_name'],
+            payload['verified_data'], idempotency_key=key
+        ) > 0
+    if kind == 'fishbone_columns':
+        if apply_comment and payload['session_comments'] and not db_manager.save_fishbone_session_comment(payload['session_name'], payload['session_comments']):
+            return False
+        frame = pd.DataFrame(payload['columns'], columns=fishbone_pipeline.FRAME_COLUMNS)
+        if frame.empty: return True
+        return fishbone_pipeline.save_fishbone_frame(
+            frame, payload['session_name'], payload['problem_statement'], payload['group_name'], idempotency_key=key
+        ) > 0
+    raise ValueError(f"Unknown spool job kind: {kind}")
+
+def flush_once() -> int:
+    """Drains one batch of due jobs from the spool. Returns how many were applied."""
+    conn = _connect()
+    applied = 0
+    try:
+        now = time.time()
+        jobs = conn.execute("""
+            SELECT idempotency_key, kind, payload, attempts, enqueued_at FROM spool
+            WHERE next_attempt_at <= ? AND attempts < ? ORDER BY enqueued_at LIMIT ?;
+        """, (now, config.WRITE_SPOOL_MAX_ATTEMPTS, config.WRITE_SPOOL_BATCH_SIZE)).fetchall()
+        # Checked here rather than once at startup, so a database that was unreachable
+        # when the flusher started still gets the table (it is a no-op once it exists)
+        if jobs and not db_manager.create_applied_writes_table(): return 0
+        for key, kind, payload, attempts, enqueued_at in jobs:
+            payload = json.loads(payload)
+            session_name = payload.get('session_name') if kind in ('fishbone', 'fishbone_columns') else None
+            newest_applied = session_name and conn.execute(
+                "SELECT enqueued_at FROM applied_sessions WHERE session_name = ?;", (session_name,)
+            ).fetchone()
+            try:
+                ok = _apply_job(kind, payload, key, apply_comment=not (newest_applied and newest_applied[0] > enqueued_at))
+                error = None if ok else "Database write failed (see server log)."
+            except Exception as e:
+                ok, error = False, str(e)
+            with conn:
+                if ok:
+                    conn.execute("DELETE FROM spool WHERE idempotency_key = ?;", (key,))
+                    if session_name:
+                        conn.execute("""
+                            INSERT INTO applied_sessions (session_name, enqueued_at) VALUES (?, ?)
+                            ON CONFLICT (session_name) DO UPDATE SET enqueued_at = MAX(enqueued_at, excluded.enqueued_at);
+                        """, (session_name, enqueued_at))
+                    applied += 1
+                else:
+                    backoff = min(2 ** attempts, config.WRITE_SPOOL_MAX_BACKOFF)
+                    conn.execute("""
+                        UPDATE spool SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                        WHERE idempotency_key = ?;
+                    """, (time.time() + backoff, error, key))
+                    if attempts + 1 >= config.WRITE_SPOOL_MAX_ATTEMPTS:
+                        print(f"❌ Spool job {key} gave up after {attempts + 1} attempts: {error}")
+                    else:
+                        print(f"❌ Spool job {key} failed (attempt {attempts + 1}), retrying in {backoff}s: {error}")
+    finally:
+        conn.close()
+    return applied
+
+def _flush_forever():
+    while True:
+        try:
+            if flush_once() == 0:
+                # Nothing was ready: sleep until a new job arrives or a retry comes due
+                _wake_event.wait(timeout=1.0)
+                _wake_event.clear()
+        except Exception as e:
+            print(f"❌ Error while flushing the write spool: {e}")
+            time.sleep(1.0)
+
+def start_flusher():
+    """Starts the background flusher once per process. Safe to call on every Streamlit rerun."""
+    global _flusher_thread
+    with _flusher_lock:
+        if _flusher_thread is None or not _flusher_thread.is_alive():
+            _flusher_thread = threading.Thread(target=_flush_forever, name="write-spool-flusher", daemon=True)
+            _flusher_thread.start()
+
+def retry_dead_jobs() -> int:
+    """Puts every parked (dead) job back in the queue with a fresh attempt count. Returns how many."""
+    conn = _connect()
+    try:
+        with conn:
+            requeued = conn.execute(
+                "UPDATE spool SET attempts = 0, next_attempt_at = 0 WHERE attempts >= ?;", (config.WRITE_SPOOL_MAX_ATTEMPTS,)
+            ).rowcount
+    finally:
+        conn.close()
+    if requeued: _wake_event.set()
+    return requeued
+
+def get_job_state(idempotency_key: str):
+    """Returns 'pending' or 'dead' for a job still in the spool, or None once it has been applied."""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT attempts FROM spool WHERE idempotency_key = ?;", (idempotency_key,)).fetchone()
+    finally:
+        conn.close()
+    if row is None: return None
+    return 'dead' if row[0] >= config.WRITE_SPOOL_MAX_ATTEMPTS else 'pending'
+
+def count_session_jobs(kind: str, session_name: str) -> int:
+    """Counts the jobs (pending or dead) still waiting to write to a 'mindmap' or 'fishbone' session."""
+    if kind == 'mindmap':
+        session_name = db_manager.sanitize_name(session_name)
+    conn = _connect()
+    try:
+        jobs = conn.execute("SELECT kind, payload FROM spool;").fetchall()
+    finally:
+        conn.close()
+    count = 0
+    for job_kind, payload in jobs:
+        payload = json.loads(payload)
+        if kind == 'mindmap' and job_kind == 'mindmap':
+            count += db_manager.sanitize_name(payload['session_schema_name']) == session_name
+        elif kind == 'fishbone' and job_kind in ('fishbone', 'fishbone_columns'):
+            count += payload['session_name'] == session_name
+    return count
+
+def get_spool_status() -> dict:
+    """
+    Returns the number of jobs still queued (depth), the age of the oldest one (flush lag),
+    how many of those are retrying, how many were parked as dead, and the latest error of each.
+    """
+    max_attempts = config.WRITE_SPOOL_MAX_ATTEMPTS
+    conn = _connect()
+    try:
+        depth, oldest, failing, dead = conn.execute("""
+            SELECT SUM(attempts < ?), MIN(CASE WHEN attempts < ? THEN enqueued_at END),
+                   SUM(attempts > 0 AND attempts < ?), SUM(attempts >= ?)
+            FROM spool;
+        """, (max_attempts,) * 4).fetchone()
+        last_error = conn.execute(
+            "SELECT last_error FROM spool WHERE last_error IS NOT NULL AND attempts < ? ORDER BY next_attempt_at DESC LIMIT 1;",
+            (max_attempts,)
+        ).fetchone()
+        dead_error = conn.execute(
+            "SELECT last_error FROM spool WHERE attempts >= ? ORDER BY next_attempt_at DESC LIMIT 1;", (max_attempts,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return {
+        'depth': depth or 0,
+        'lag_seconds': time.time() - oldest if oldest else 0.0,
+        'failing': failing or 0,
+        'last_error': last_error[0] if last_error else None,
+        'dead': dead or 0,
+        'dead_error': dead_error[0] if dead_error else None,
+    }